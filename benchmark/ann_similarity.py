@@ -0,0 +1,142 @@
+"""
+Recall-vs-speed report of the approximate item-item similarities. Every faiss
+index is built once and searched with every given set of search parameters,
+the top similar items are compared with the exact ones. Items are taken from
+the training bookings or from synthetic bookings.
+
+Recall is the share of the exact top similar items found by the index, an
+item counts as found if its similarity is not lower than the last exact one,
+so ties of the exact top don't decrease the recall.
+
+Example:
+    python -m benchmark.ann_similarity --synthetic 200000 -k 20 \\
+        -i Flat -i IVF256,Flat nprobe=1 nprobe=8 -i HNSW32 efSearch=16 efSearch=64
+"""
+
+import argparse
+import logging
+import multiprocessing
+import sys
+import time
+
+import faiss
+import numpy as np
+import pandas as pd
+
+from benchmark.synthetic_model import generate_bookings
+from evaluation.user_item_ibcf import get_training_matrix_and_indices
+from ibcf.ann_similarity import get_item_vectors, build_index, search_index
+from ibcf.matrix_functions import get_sparse_matrix_info
+from ibcf.similarity import get_ib_topk_cosine_sim, DEFAULT_BLOCK_SIZE
+
+EPS = 1e-5
+
+
+def get_bookings():
+    if args.synthetic_users:
+        rng = np.random.RandomState(args.seed)
+        uids = ["U%08d" % i for i in range(args.synthetic_users)]
+        iids = ["P%06d" % i for i in range(args.synthetic_items or max(args.synthetic_users // 20, 50))]
+        return generate_bookings(rng, uids, iids)
+    return pd.read_csv(args.training_csv)
+
+
+def get_recall(exact_m, ann_m):
+    """ Share of the exact top similar items (columns) found by the approximate search
+    """
+    exact_m, ann_m = exact_m.tocsc(), ann_m.tocsc()
+    exact_cnt = np.diff(exact_m.indptr)
+    if not exact_cnt.sum():
+        return 1.0
+
+    # the lowest exact similarity per item
+    kth = np.full(exact_m.shape[1], np.inf)
+    non_empty = exact_cnt > 0
+    kth[non_empty] = np.minimum.reduceat(exact_m.data, exact_m.indptr[:-1][non_empty])
+
+    cols = np.repeat(np.arange(ann_m.shape[1]), np.diff(ann_m.indptr))
+    found = np.bincount(cols[ann_m.data >= kth[cols] - EPS], minlength=ann_m.shape[1])
+    return float(np.minimum(found, exact_cnt).sum()) / exact_cnt.sum()
+
+
+def main():
+    faiss.omp_set_num_threads(args.workers)
+
+    logging.info(u"Preparing training matrix")
+    ui_m, _, _ = get_training_matrix_and_indices(get_bookings())
+    logging.info(u"Training matrix: %s", get_sparse_matrix_info(ui_m))
+
+    logging.info(u"Computing exact similarities")
+    start = time.perf_counter()
+    exact_m = get_ib_topk_cosine_sim(ui_m, args.top, args.block_size, args.workers)
+    exact_s = time.perf_counter() - start
+    logging.info(u"Exact similarities: %.2fs", exact_s)
+
+    rows = [{"index": "exact", "search_params": "", "build_s": 0.0, "search_s": exact_s,
+             "total_s": exact_s, "speedup": 1.0, "recall": 1.0}]
+
+    item_vectors = get_item_vectors(ui_m)
+    for index_args in args.indices:
+        index_factory, search_params_list = index_args[0], index_args[1:] or [""]
+
+        start = time.perf_counter()
+        index = build_index(item_vectors, index_factory, args.block_size)
+        build_s = time.perf_counter() - start
+
+        for search_params in search_params_list:
+            start = time.perf_counter()
+            ann_m = search_index(index, item_vectors, args.top, search_params, args.block_size)
+            search_s = time.perf_counter() - start
+
+            row = {
+                "index": index_factory,
+                "search_params": search_params,
+                "build_s": build_s,
+                "search_s": search_s,
+                "total_s": build_s + search_s,
+                "speedup": exact_s / (build_s + search_s),
+                "recall": get_recall(exact_m, ann_m),
+            }
+            logging.info(u"%s %s: build %.2fs, search %.2fs, recall@%s %.4f",
+                         index_factory, search_params, build_s, search_s, args.top, row["recall"])
+            rows.append(row)
+
+    report_df = pd.DataFrame(rows, columns=["index", "search_params", "build_s", "search_s",
+                                            "total_s", "speedup", "recall"])
+    report_df.to_csv(args.output_path, index=False)
+    logging.info(u"Report:\n%s", report_df.to_string(index=False))
+    logging.info(u"Report has been written to: %s", args.output_path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--trf", dest="training_csv",
+                        help=u"Training data file name, the bookings with code and propcode columns")
+    source.add_argument("--synthetic", type=int, dest="synthetic_users",
+                        help=u"Number of users of generated synthetic bookings")
+    parser.add_argument("--synthetic-items", type=int, dest="synthetic_items",
+                        help=u"Number of items of generated synthetic bookings. Default: 5%% of users, at least 50")
+    parser.add_argument("-i", action="append", nargs="+", required=True, dest="indices",
+                        metavar=("INDEX", "SEARCH_PARAMS"),
+                        help=u"faiss index factory string followed by search parameters to try, "
+                             u"e.g. -i IVF256,Flat nprobe=1 nprobe=8. Can be repeated")
+    parser.add_argument("-k", default=20, type=int, dest="top",
+                        help=u"Number of similar items per an item. Default: 20")
+    parser.add_argument("--block-size", default=DEFAULT_BLOCK_SIZE, type=int, dest="block_size",
+                        help=u"Number of items processed at once. Default: %s" % DEFAULT_BLOCK_SIZE)
+    parser.add_argument("-w", default=multiprocessing.cpu_count(), type=int, dest="workers",
+                        help=u"Number of worker processes and faiss threads. Default: number of CPUs")
+    parser.add_argument("-o", default='ann_similarity.csv', dest="output_path",
+                        help=u"Path to the output CSV report. Default: ann_similarity.csv")
+    parser.add_argument("-s", default=42, type=int, dest="seed", help=u"Random seed. Default: 42")
+    parser.add_argument("--log-level", default='INFO', dest="log_level",
+                        choices=['DEBUG', 'INFO', 'WARNINGS', 'ERROR'], help=u"Logging level")
+
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format='%(asctime)s %(levelname)s:%(message)s', stream=sys.stdout, level=getattr(logging, args.log_level)
+    )
+
+    main()
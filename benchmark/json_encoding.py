@@ -0,0 +1,149 @@
+"""
+Micro-benchmark of the JSON encoding of recommendation responses. It compares
+the former encoding (recursive copy of dicts + numpy scalars encoded by the
+default hook) with APIApp.dump_json. Responses are computed by the model of
+a server config or generated with the schema of /api/cluster/recs/.
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import timeit
+
+import numpy as np
+from flask import Config
+
+from server.app import APIApp
+from server.functions import clean_json_dict_keys
+
+
+class LegacyJsonEncoder(json.JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, set):
+            return list(obj)
+        if isinstance(obj, np.int32):
+            return int(obj)
+        if isinstance(obj, np.float64):
+            return float(obj)
+        return json.JSONEncoder.default(self, obj)
+
+
+def legacy_dump_json(rv):
+    return json.dumps(clean_json_dict_keys(rv), cls=LegacyJsonEncoder)
+
+
+def to_numpy_types(rv):
+    """Converts a response to the types the providers returned before, e.g. numpy bg_id and scores
+    """
+    if isinstance(rv, dict):
+        return {k: to_numpy_types(v) for k, v in rv.items()}
+    if isinstance(rv, list):
+        return [to_numpy_types(v) for v in rv]
+    if isinstance(rv, bool):
+        return rv
+    if isinstance(rv, int):
+        return np.int32(rv)
+    if isinstance(rv, float):
+        return np.float64(rv)
+    if isinstance(rv, str):
+        return np.str_(rv)
+    return rv
+
+
+def get_features(prefix, n):
+    return {"%s%s" % (prefix, i): random.random() for i in range(n)}
+
+
+def generate_response(top_clusters, top_items, n_features):
+    recs = []
+    for _ in range(top_clusters):
+        recs.append({
+            "bg_id": random.randint(0, 1000),
+            "score": random.random(),
+            "features": get_features("bf", n_features),
+            "properties": [
+                {"propcode": "P%05d" % random.randint(0, 99999), "score": random.random()}
+                for _ in range(top_items)
+            ]
+        })
+    return {"result": {
+        "user": get_features("uf", n_features),
+        "user_cluster": {random.randint(0, 1000): get_features("uf", n_features)},
+        "recs": recs,
+        "prev_bookings_summary": get_features("bf", n_features),
+    }}
+
+
+def get_model_responses(config_path, n_responses, top_clusters, top_items):
+    from server.api.views import get_cluster_based_results
+    from server.reloader import load_model
+
+    config = Config(os.getcwd())
+    config.from_pyfile(os.path.abspath(config_path))
+    model = load_model(config)
+
+    uids = model.user_dp.get_uids()[:n_responses]
+    results = get_cluster_based_results(model, uids, top_clusters, top_items)
+    return [{"result": results[uid]} for uid in uids]
+
+
+def bench(name, dump, responses):
+    times = timeit.repeat(lambda: [dump(rv) for rv in responses], number=args.number, repeat=args.repeat)
+    per_call = min(times) / args.number / len(responses)
+    logging.info(u"%-36s %8.1f us per response", name, per_call * 1e6)
+    return per_call
+
+
+def main():
+    random.seed(args.seed)
+    if args.config_path:
+        responses = get_model_responses(args.config_path, args.n_responses, args.top_clusters, args.top_items)
+    else:
+        responses = [
+            generate_response(args.top_clusters, args.top_items, args.n_features)
+            for _ in range(args.n_responses)
+        ]
+    numpy_responses = [to_numpy_types(rv) for rv in responses]
+
+    avg_size = np.mean([len(APIApp.dump_json(rv)) for rv in responses])
+    logging.info(u"%s responses, %.0f bytes on average", len(responses), avg_size)
+
+    for rv, numpy_rv in zip(responses, numpy_responses):
+        assert json.loads(APIApp.dump_json(rv)) == json.loads(legacy_dump_json(numpy_rv))
+
+    legacy = bench(u"legacy encoder, numpy values", legacy_dump_json, numpy_responses)
+    bench(u"dump_json, numpy values", APIApp.dump_json, numpy_responses)
+    current = bench(u"dump_json, native values", APIApp.dump_json, responses)
+    logging.info(u"Speedup: %.2fx", legacy / current)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("-c", dest="config_path",
+                        help=u"Path to a server config, responses are generated if it is not set")
+    parser.add_argument("-n", default=200, type=int, dest="n_responses",
+                        help=u"Number of responses. Default: 200")
+    parser.add_argument("--top", default=3, type=int, dest="top_clusters",
+                        help=u"Number of recommended clusters. Default: 3")
+    parser.add_argument("--top-items", default=5, type=int, dest="top_items",
+                        help=u"Number of items per cluster. Default: 5")
+    parser.add_argument("--features", default=10, type=int, dest="n_features",
+                        help=u"Number of features per user and cluster of generated responses. Default: 10")
+    parser.add_argument("--number", default=20, type=int, dest="number",
+                        help=u"Number of encodings of all responses per measurement. Default: 20")
+    parser.add_argument("--repeat", default=5, type=int, dest="repeat",
+                        help=u"Number of measurements, the best one is reported. Default: 5")
+    parser.add_argument("-s", default=42, type=int, dest="seed", help=u"Random seed. Default: 42")
+    parser.add_argument("--log-level", default='INFO', dest="log_level",
+                        choices=['DEBUG', 'INFO', 'WARNINGS', 'ERROR'], help=u"Logging level")
+
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format='%(asctime)s %(levelname)s:%(message)s', stream=sys.stdout, level=getattr(logging, args.log_level)
+    )
+
+    main()
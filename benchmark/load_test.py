@@ -0,0 +1,248 @@
+"""
+Load test of the recommendation API. The script starts the server with the
+given config, model bundle or synthetic sources, replays a mix of requests
+to /api/cluster/recs/ and /api/item/recs/ from several threads and reports
+RPS and latency percentiles. The result is written to a JSON file and can
+be compared with a baseline result, the script fails on regressions.
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import urlopen
+
+import numpy as np
+from werkzeug.serving import make_server
+
+from benchmark.synthetic_model import generate_sources, write_config
+from server import get_app
+
+ENDPOINTS = ["/api/cluster/recs/", "/api/item/recs/"]
+PERCENTILES = [50, 95, 99]
+
+
+def get_config_path():
+    if args.config_path:
+        return os.path.abspath(args.config_path)
+
+    output_dir = tempfile.mkdtemp(prefix="load_test_")
+    config_path = os.path.join(output_dir, "config.py")
+    if args.bundle_path:
+        write_config(config_path, {'MODEL_BUNDLE_PATH': args.bundle_path})
+    else:
+        logging.info(u"Generating synthetic sources of %s users to: %s", args.synthetic_users, output_dir)
+        write_config(config_path, generate_sources(output_dir, args.synthetic_users, seed=args.seed))
+    return config_path
+
+
+def get_uid_groups(model, rng):
+    """ Splits known uids into heavy bookers (top 5% by booked items) and others
+    """
+    uids = sorted(set(model.user_dp.get_uids()) | set(model.item_feature_dp.get_uids()))
+    n_booked = np.array([model.booking_dp.get_iid_cols_for_uid(uid).size for uid in uids])
+    order = np.argsort(-n_booked, kind="mergesort")
+    n_heavy = max(len(uids) // 20, 1)
+
+    heavy_uids = [uids[i] for i in order[:n_heavy]]
+    other_uids = [uids[i] for i in order[n_heavy:]] or heavy_uids
+    unknown_uids = ["unknown_%s" % rng.randint(0, 10 ** 9) for _ in range(1000)]
+    return heavy_uids, other_uids, unknown_uids
+
+
+def generate_requests(model, n_requests, rng):
+    """ Generates (endpoint, query string) pairs with the mix of uids and args set by the script args
+    """
+    heavy_uids, other_uids, unknown_uids = get_uid_groups(model, rng)
+
+    requests = []
+    for _ in range(n_requests):
+        endpoint = rng.choice(ENDPOINTS)
+
+        p = rng.random()
+        if p < args.unknown_share:
+            uid = rng.choice(unknown_uids)
+        elif p < args.unknown_share + args.heavy_share:
+            uid = rng.choice(heavy_uids)
+        else:
+            uid = rng.choice(other_uids)
+
+        query = {"uid": uid}
+        if rng.random() < args.non_default_share:
+            query["top"] = rng.randint(1, 10)
+            if endpoint == ENDPOINTS[0]:
+                query["top_items"] = rng.randint(1, 20)
+        requests.append((endpoint, urlencode(query)))
+    return requests
+
+
+def replay(base_url, requests):
+    """ Sends the requests from args.threads threads
+
+    :return: latencies per endpoint, number of errors and the total duration
+    """
+    latencies = {endpoint: [] for endpoint in ENDPOINTS}
+    errors = [0]
+    lock = threading.Lock()
+    next_request = iter(requests)
+
+    def worker():
+        while True:
+            with lock:
+                request = next(next_request, None)
+            if request is None:
+                return
+
+            endpoint, query = request
+            start = time.perf_counter()
+            try:
+                with urlopen("%s%s?%s" % (base_url, endpoint, query)) as response:
+                    response.read()
+                failed = False
+            except (HTTPError, IOError):
+                failed = True
+            latency = time.perf_counter() - start
+
+            with lock:
+                latencies[endpoint].append(latency)
+                errors[0] += failed
+
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0], time.perf_counter() - start
+
+
+def get_latency_stats(latencies):
+    latencies = np.array(latencies) * 1000
+    stats = {"p%s_ms" % p: float(v) for p, v in zip(PERCENTILES, np.percentile(latencies, PERCENTILES))}
+    stats["mean_ms"] = float(latencies.mean())
+    stats["max_ms"] = float(latencies.max())
+    return stats
+
+
+def compare_with_baseline(result, baseline):
+    """ Returns the list of metrics that are worse than in the baseline by more than the tolerance
+    """
+    regressions = []
+    if result["rps"] < baseline["rps"] * (1 - args.tolerance):
+        regressions.append(("rps", baseline["rps"], result["rps"]))
+
+    for endpoint, stats in result["endpoints"].items():
+        baseline_stats = baseline["endpoints"].get(endpoint)
+        if baseline_stats is None:
+            continue
+        for p in PERCENTILES[1:]:
+            key = "p%s_ms" % p
+            if stats[key] > baseline_stats[key] * (1 + args.tolerance):
+                regressions.append(("%s %s" % (endpoint, key), baseline_stats[key], stats[key]))
+    return regressions
+
+
+def main():
+    rng = random.Random(args.seed)
+    app = get_app(get_config_path())
+
+    server = None
+    base_url = args.url
+    if base_url is None:
+        server = make_server("127.0.0.1", 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = "http://127.0.0.1:%s" % server.server_port
+    logging.info(u"Testing server: %s", base_url)
+
+    requests = generate_requests(app.model, args.n_requests + args.warmup, rng)
+    replay(base_url, requests[:args.warmup])
+
+    logging.info(u"Sending %s requests from %s threads", args.n_requests, args.threads)
+    latencies, errors, duration = replay(base_url, requests[args.warmup:])
+    if server is not None:
+        server.shutdown()
+
+    all_latencies = [latency for endpoint_latencies in latencies.values() for latency in endpoint_latencies]
+    result = {
+        "params": {
+            "n_requests": args.n_requests,
+            "threads": args.threads,
+            "unknown_share": args.unknown_share,
+            "heavy_share": args.heavy_share,
+            "non_default_share": args.non_default_share,
+            "model_version": app.model.version,
+        },
+        "errors": errors,
+        "duration_s": duration,
+        "rps": len(all_latencies) / duration,
+        "latency": get_latency_stats(all_latencies),
+        "endpoints": {
+            endpoint: get_latency_stats(endpoint_latencies)
+            for endpoint, endpoint_latencies in latencies.items() if endpoint_latencies
+        },
+    }
+
+    logging.info(u"RPS: %.1f, errors: %s", result["rps"], errors)
+    for endpoint, stats in sorted(result["endpoints"].items()):
+        logging.info(u"%s p50: %.2fms, p95: %.2fms, p99: %.2fms",
+                     endpoint, stats["p50_ms"], stats["p95_ms"], stats["p99_ms"])
+
+    with open(args.output_path, "w") as f:
+        json.dump(result, f, indent=2, sort_keys=True)
+    logging.info(u"Result has been written to: %s", args.output_path)
+
+    if args.baseline_path:
+        with open(args.baseline_path) as f:
+            regressions = compare_with_baseline(result, json.load(f))
+        for name, baseline_value, value in regressions:
+            logging.error(u"Regression of %s: %.2f -> %.2f", name, baseline_value, value)
+        if regressions or errors:
+            sys.exit(1)
+        logging.info(u"No regressions against the baseline")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("-c", dest="config_path", help=u"Path to a server config")
+    source.add_argument("-m", dest="bundle_path", help=u"Path to a model bundle")
+    source.add_argument("--synthetic", type=int, dest="synthetic_users",
+                        help=u"Number of users of generated synthetic sources")
+    parser.add_argument("--url", dest="url",
+                        help=u"URL of an already running server, e.g. http://localhost:8085. "
+                             u"The model of the config is used only to choose uids")
+    parser.add_argument("-n", default=5000, type=int, dest="n_requests",
+                        help=u"Number of requests. Default: 5000")
+    parser.add_argument("-t", default=8, type=int, dest="threads",
+                        help=u"Number of concurrent clients. Default: 8")
+    parser.add_argument("--warmup", default=200, type=int, dest="warmup",
+                        help=u"Number of requests sent before measuring. Default: 200")
+    parser.add_argument("--unknown-share", default=0.1, type=float, dest="unknown_share",
+                        help=u"Share of requests with unknown uids. Default: 0.1")
+    parser.add_argument("--heavy-share", default=0.2, type=float, dest="heavy_share",
+                        help=u"Share of requests of heavy bookers. Default: 0.2")
+    parser.add_argument("--non-default-share", default=0.3, type=float, dest="non_default_share",
+                        help=u"Share of requests with non-default top args. Default: 0.3")
+    parser.add_argument("-o", default='load_test.json', dest="output_path",
+                        help=u"Path to the output JSON file. Default: load_test.json")
+    parser.add_argument("-b", dest="baseline_path", help=u"Path to a baseline result to compare with")
+    parser.add_argument("--tolerance", default=0.2, type=float, dest="tolerance",
+                        help=u"Allowed relative degradation of RPS and p95/p99 latency. Default: 0.2")
+    parser.add_argument("-s", default=42, type=int, dest="seed", help=u"Random seed. Default: 42")
+    parser.add_argument("--log-level", default='INFO', dest="log_level",
+                        choices=['DEBUG', 'INFO', 'WARNINGS', 'ERROR'], help=u"Logging level")
+
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format='%(asctime)s %(levelname)s:%(message)s', stream=sys.stdout, level=getattr(logging, args.log_level)
+    )
+
+    main()
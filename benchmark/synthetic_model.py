@@ -0,0 +1,155 @@
+"""
+The script generates synthetic sources of the recommendation server: user
+and booking clusters, user, booking and property features and the cluster
+recs matrix, in the formats produced by the clustering and model scripts.
+Bookings per user and item popularity are skewed like in the real data.
+"""
+
+import argparse
+import logging
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+from scipy.io import mmwrite
+from scipy.sparse import random as sparse_random
+
+USER_FEATURES = ["uf_%s" % i for i in range(20)]
+BOOKING_FEATURES = ["bf_%s" % i for i in range(30)]
+PROPERTY_FEATURES = ["pf_%s" % i for i in range(40)]
+YEARS = [2013, 2014, 2015, 2016]
+
+
+def _write_explanation(f, explanation):
+    f.write("Explanation:\n")
+    for feature, score in explanation.items():
+        f.write("-> %s: %.3f\n" % (feature, score))
+
+
+def _get_explanation(rng, features):
+    chosen = rng.choice(features, rng.randint(1, 4), replace=False)
+    return {feature: rng.uniform(0.6, 1.0) for feature in chosen}
+
+
+def generate_bookings(rng, uids, iids):
+    # a few heavy bookers and many users with one or two bookings
+    bookings_per_uid = np.minimum(rng.geometric(0.45, len(uids)), 50)
+    popularity = rng.zipf(1.3, len(iids)).astype(float)
+    popularity /= popularity.sum()
+
+    n_bookings = bookings_per_uid.sum()
+    return pd.DataFrame({
+        "code": np.repeat(uids, bookings_per_uid),
+        "bookcode": ["B%08d" % i for i in range(n_bookings)],
+        "propcode": np.array(iids)[rng.choice(len(iids), n_bookings, p=popularity)],
+        "year": rng.choice(YEARS, n_bookings),
+    })
+
+
+def generate_sources(output_dir, n_users, n_items=None, seed=42):
+    """ Generates the sources to the folder
+
+    :return: {config key: path, ...} to put into the server config
+    """
+    rng = np.random.RandomState(seed)
+    n_items = n_items or max(n_users // 20, 50)
+    n_ugs = max(n_users // 200, 5)
+    n_bgs = max(n_items // 10, 5)
+
+    uids = ["U%08d" % i for i in range(n_users)]
+    iids = ["P%06d" % i for i in range(n_items)]
+    bdf = generate_bookings(rng, uids, iids)
+    for feature in BOOKING_FEATURES:
+        bdf[feature] = rng.binomial(1, 0.2, len(bdf))
+
+    paths = {
+        'UG_FILE_PATH': os.path.join(output_dir, "user.txt"),
+        'USER_FEATURE_FILE_PATH': os.path.join(output_dir, "user.csv"),
+        'BG_FILE_PATH': os.path.join(output_dir, "booking.txt"),
+        'BOOKING_FEATURE_FILE_PATH': os.path.join(output_dir, "booking.csv"),
+        'PROPERTY_FILE_PATH': os.path.join(output_dir, "property.csv"),
+        'PROPERTY_FEATURE_FILE_PATH': os.path.join(output_dir, "property_feature.csv"),
+        'UG_BG_RECS_MATRIX_PATH': os.path.join(output_dir, "ug_bg_recs.mtx"),
+    }
+    bdf.to_csv(paths['BOOKING_FEATURE_FILE_PATH'], index=False)
+
+    udf = bdf.groupby("code").size().rename("booking_cnt").reset_index()
+    for feature in USER_FEATURES:
+        udf[feature] = rng.binomial(udf.booking_cnt, 0.3)
+    udf.to_csv(paths['USER_FEATURE_FILE_PATH'], index=False)
+
+    # 80% of properties are active
+    pdf = pd.DataFrame({"propcode": iids, "active": rng.choice([-1, 0], n_items, p=[0.8, 0.2])})
+    pdf.to_csv(paths['PROPERTY_FILE_PATH'], index=False)
+
+    pfdf = pd.DataFrame({
+        "propcode": np.repeat(iids, len(YEARS)),
+        "year": np.tile(YEARS, n_items),
+    })
+    for feature in PROPERTY_FEATURES:
+        pfdf[feature] = rng.binomial(1, 0.3, len(pfdf))
+    pfdf.to_csv(paths['PROPERTY_FEATURE_FILE_PATH'], index=False)
+
+    ug_per_uid = rng.randint(0, n_ugs, n_users)
+    with open(paths['UG_FILE_PATH'], "w") as f:
+        f.write("*** BEGIN INFO ***\n*** END INFO ***\n")
+        for ug_id in range(n_ugs):
+            f.write("Cluster #%s [%s]\n" % (ug_id, (ug_per_uid == ug_id).sum()))
+            _write_explanation(f, _get_explanation(rng, USER_FEATURES))
+            f.write("Users: %s\n" % ", ".join(np.array(uids)[ug_per_uid == ug_id]))
+            f.write("---\n")
+
+    bdf["bg_id"] = rng.randint(0, n_bgs, len(bdf))
+    with open(paths['BG_FILE_PATH'], "w") as f:
+        f.write("*** BOOKINGS INFO ***\n***\n")
+        for bg_id, cluster in bdf.groupby("bg_id"):
+            f.write("Cluster #%s [%s | %s]\n" % (bg_id, cluster.bookcode.nunique(), cluster.propcode.nunique()))
+            _write_explanation(f, _get_explanation(rng, BOOKING_FEATURES))
+            f.write("Bookings: %s\n" % ", ".join(cluster.bookcode.tolist()))
+            f.write("Items: %s\n" % ", ".join(cluster.propcode.unique().tolist()))
+            f.write("---\n")
+
+    recs_m = sparse_random(n_ugs, bdf.bg_id.nunique(), density=0.3, format="csr", random_state=rng)
+    mmwrite(paths['UG_BG_RECS_MATRIX_PATH'], recs_m)
+    return paths
+
+
+def write_config(config_path, paths):
+    with open(config_path, "w") as f:
+        f.write("from server.etc.config import *\n\n")
+        for key, path in sorted(paths.items()):
+            f.write("%s = %r\n" % (key, os.path.abspath(path)))
+
+
+def main():
+    if not os.path.exists(args.output_dir):
+        os.makedirs(args.output_dir)
+
+    logging.info(u"Generating sources of %s users", args.n_users)
+    paths = generate_sources(args.output_dir, args.n_users, args.n_items, args.seed)
+
+    config_path = os.path.join(args.output_dir, "config.py")
+    write_config(config_path, paths)
+    logging.info(u"Server config has been written to: %s", config_path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("-o", default='synthetic', dest="output_dir",
+                        help=u"Path to the output folder. Default: synthetic")
+    parser.add_argument("-u", default=10000, type=int, dest="n_users",
+                        help=u"Number of users. Default: 10000")
+    parser.add_argument("-i", default=None, type=int, dest="n_items",
+                        help=u"Number of items. Default: 5%% of users, at least 50")
+    parser.add_argument("-s", default=42, type=int, dest="seed", help=u"Random seed. Default: 42")
+    parser.add_argument("--log-level", default='INFO', dest="log_level",
+                        choices=['DEBUG', 'INFO', 'WARNINGS', 'ERROR'], help=u"Logging level")
+
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format='%(asctime)s %(levelname)s:%(message)s', stream=sys.stdout, level=getattr(logging, args.log_level)
+    )
+
+    main()
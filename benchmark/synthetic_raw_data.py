@@ -0,0 +1,330 @@
+"""
+The script generates synthetic raw HH exports: bookings, contacts, properties
+and properties' features. The files have the columns, the delimiter, the date
+format and the breakpoints expected by the scripts from the `preprocessing`
+folder, so the whole pipeline can be run on them. The popularity of
+properties and the number of bookings per contact are skewed like in
+the real data. The size of the data is controlled by the scale factor,
+scale 1 is about the size of the real exports.
+"""
+
+import argparse
+import logging
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from preprocessing.booking import OLD_BREAKPOINT_MATCHER
+from preprocessing.booking import COLS_TO_DROP as BOOKING_COLS_TO_DROP
+from preprocessing.contact import COLS_TO_DROP as CONTACT_COLS_TO_DROP
+from preprocessing.property import COLS_TO_DROP as PROPERTY_COLS_TO_DROP
+from preprocessing.property_feature import FEATURES_TO_DROP, YES_NO_COLS, INT_COLS, CATEGORICAL_COLS
+
+DELIMITER = ";"
+DATE_FORMAT = "%d/%m/%Y"
+
+# sizes of scale 1
+N_PROPERTIES = 1000
+N_CONTACTS = 60000
+BOOKER_SHARE = 0.7
+
+# breakpoints of these years are missed in the exports, they are restored by zone names
+LAST_YEAR_WITHOUT_BREAKPOINTS = max(OLD_BREAKPOINT_MATCHER)
+BREAKPOINT_SCHEDULE = OLD_BREAKPOINT_MATCHER[2007]
+
+REGIONS = {
+    "Devon": ["Salcombe", "Dartmouth", "Woolacombe", "Hope Cove"],
+    "Cornwall": ["Padstow", "St Ives", "Fowey", "Rock"],
+    "Somerset": ["Exmoor", "Porlock", "Minehead"],
+    "Dorset": ["Lyme Regis", "Charmouth"],
+}
+ZONE_NAMES = ["Low", "Mid", "High", "Peak"]
+SOURCES = {
+    "Internet": ["Google", "Website", "Email"],
+    "Brochure": ["Brochure request", "Brochure mailing"],
+    "Repeat": ["Repeat customer"],
+    "Recommendation": ["Friend", "Owner"],
+}
+OAC_GROUPS = {
+    "Blue Collar Communities": ["Terraced Blue Collar", "Younger Blue Collar", "Older Blue Collar"],
+    "City Living": ["Transient Communities", "Settled in the City"],
+    "Countryside": ["Village Life", "Agricultural", "Accessible Countryside"],
+    "Prospering Suburbs": ["Prospering Younger Families", "Prospering Older Families", "Thriving Suburbs"],
+    "Constrained by Circumstances": ["Senior Communities", "Older Workers"],
+}
+CATEGORICAL_VALUES = {
+    "charges": ["Included", "Electricity extra", "Oil extra"],
+    "enhanced": ["Yes"],
+    "groceries": ["On request", "Hamper"],
+    "heating": ["Central heating", "Storage heaters", "Underfloor heating"],
+    "linen": ["Included", "Extra"],
+    "parking": ["Private", "Street", "Garage"],
+    "towels": ["Included", "Extra"],
+    "stairgate": ["Yes", "On request"],
+    "vineyard": ["Yes"],
+}
+
+
+def format_dates(dates):
+    return pd.Series(dates).dt.strftime(DATE_FORMAT).values
+
+
+def with_missing(rng, values, share):
+    """ Replaces a share of values with NaN
+    """
+    values = pd.Series(values).astype(object)
+    values[rng.random_sample(values.size) < share] = np.nan
+    return values.values
+
+
+def get_popularity(rng, n):
+    """ Zipf-like popularity weights in random order
+    """
+    weights = 1.0 / np.arange(1, n + 1) ** 0.9
+    rng.shuffle(weights)
+    return weights / weights.sum()
+
+
+def get_breakpoint(sdate):
+    breakpoint = BREAKPOINT_SCHEDULE[-1][2]
+    for month, day, name in BREAKPOINT_SCHEDULE:
+        if month > sdate.month or (month == sdate.month and day > sdate.day):
+            break
+        breakpoint = name
+    return breakpoint
+
+
+def generate_properties(rng, n_properties, years):
+    propcodes = np.array(["P%05d" % i for i in range(n_properties)])
+    # most properties are available from the first year, the others join later
+    first_year = np.where(rng.random_sample(n_properties) < 0.5, years[0], rng.choice(years, n_properties))
+
+    regions = rng.choice(sorted(REGIONS), n_properties)
+    places = np.array([rng.choice(REGIONS[region]) for region in regions])
+    sleeps = rng.randint(2, 17, n_properties)
+    stars = with_missing(rng, rng.choice([3, 4, 5], n_properties, p=[0.3, 0.5, 0.2]), 0.03)
+
+    rows = []
+    for i in range(n_properties):
+        for year in range(first_year[i], years[-1] + 1):
+            rows.append((i, year))
+    prop_ids, prop_years = map(np.array, zip(*rows))
+    n = prop_ids.size
+
+    df = pd.DataFrame({
+        "propcode": propcodes[prop_ids],
+        "propid": prop_ids + 1000,
+        "year": prop_years,
+        "pname": ["%s Cottage %s" % (places[i], i) for i in prop_ids],
+        "region": regions[prop_ids],
+        "place": places[prop_ids],
+        "county": regions[prop_ids],
+        "postcode": ["TQ%s %sAB" % (i % 20, i % 10) for i in prop_ids],
+        # -1 is an active property
+        "active": rng.choice([-1, 0], n, p=[0.85, 0.15]),
+        "bathrooms": np.maximum(sleeps[prop_ids] // 4, 1),
+        "bedrooms": (sleeps[prop_ids] + 1) // 2,
+        "bunks": rng.binomial(1, 0.2, n),
+        "doubles": np.maximum(sleeps[prop_ids] // 4, 1),
+        "familyrooms": rng.binomial(1, 0.1, n),
+        "sleeps": sleeps[prop_ids],
+        "twin": rng.binomial(2, 0.4, n),
+        "shortbreakok": rng.choice([True, False], n),
+        "stars": stars[prop_ids],
+    })
+    for col in PROPERTY_COLS_TO_DROP:
+        df[col] = rng.randint(0, 100, n)
+    return df
+
+
+def generate_contacts(rng, n_contacts, years):
+    codes = np.array(["C%07d" % i for i in range(n_contacts)])
+    oac_supergroups = rng.choice(sorted(OAC_GROUPS), n_contacts)
+    orig_categories = rng.choice(sorted(SOURCES), n_contacts)
+
+    df = pd.DataFrame({
+        "code": codes,
+        "oac_supergroupdesc": oac_supergroups,
+        "oac_groupdesc": with_missing(
+            rng, [rng.choice(OAC_GROUPS[group]) for group in oac_supergroups], 0.05
+        ),
+        "oac_subgroupdesc": [group[:3].upper() for group in oac_supergroups],
+        "origsourcedesc": [rng.choice(SOURCES[category]) for category in orig_categories],
+        "origsourcecategory": orig_categories,
+    })
+
+    dates = format_dates(pd.to_datetime("%s-01-01" % years[0]) + pd.to_timedelta(
+        rng.randint(0, 365 * len(years), n_contacts), unit="D"
+    ))
+    for col in CONTACT_COLS_TO_DROP:
+        if "date" in col:
+            df[col] = with_missing(rng, dates, 0.3)
+        elif "year" in col:
+            df[col] = rng.choice(years, n_contacts)
+        else:
+            df[col] = rng.randint(0, 10, n_contacts)
+    return df
+
+
+def generate_bookings(rng, pdf, contact_codes, years):
+    # a few contacts book a lot, most of them book once
+    n_bookers = int(contact_codes.size * BOOKER_SHARE)
+    bookers = rng.choice(contact_codes, n_bookers, replace=False)
+    bookings_per_booker = np.minimum(rng.geometric(0.5, n_bookers), 60)
+    codes = np.repeat(bookers, bookings_per_booker)
+    n = codes.size
+
+    # the business grows, recent years have more bookings
+    year_weights = np.linspace(1.0, 2.0, len(years))
+    booking_years = rng.choice(years, n, p=year_weights / year_weights.sum())
+
+    popularity = dict(zip(pdf.propcode.unique(), get_popularity(rng, pdf.propcode.nunique())))
+    propcodes = np.empty(n, dtype=object)
+    for year in years:
+        mask = booking_years == year
+        year_propcodes = pdf.propcode[pdf.year == year].values
+        weights = np.array([popularity[propcode] for propcode in year_propcodes])
+        propcodes[mask] = rng.choice(year_propcodes, mask.sum(), p=weights / weights.sum())
+
+    sdates = pd.to_datetime(booking_years.astype(str)) + pd.to_timedelta(rng.randint(0, 365, n), unit="D")
+    # a booking can start in a year and finish in the next one, but its year is the start year
+    booking_years = sdates.year.values
+    fdates = sdates + pd.to_timedelta(rng.choice([3, 4, 7, 7, 7, 10, 14], n), unit="D")
+    bookdates = sdates - pd.to_timedelta(rng.randint(1, 300, n), unit="D")
+
+    has_breakpoint = booking_years > LAST_YEAR_WITHOUT_BREAKPOINTS
+    breakpoints = np.array([get_breakpoint(sdate) for sdate in sdates], dtype=object)
+    breakpoints[~has_breakpoint] = np.nan
+    zone_names = rng.choice(ZONE_NAMES, n).astype(object)
+    zone_names[has_breakpoint] = np.nan
+    # a few old bookings have neither breakpoints nor zone names
+    zone_names[~has_breakpoint & (rng.random_sample(n) < 0.02)] = np.nan
+
+    prop_info = pdf.drop_duplicates("propcode").set_index("propcode").loc[propcodes]
+    adults = rng.choice([1, 2, 2, 2, 3, 4, 4, 6, 8], n)
+    children = rng.poisson(0.8, n)
+    avg_spend_per_head = np.round(rng.lognormal(5.5, 0.6, n), 2)
+    categories = rng.choice(sorted(SOURCES), n, p=[0.2, 0.4, 0.2, 0.2])
+
+    df = pd.DataFrame({
+        "bookcode": ["B%08d" % i for i in range(n)],
+        "code": codes,
+        "propcode": propcodes,
+        "pname": prop_info.pname.values,
+        "region": prop_info.region.values,
+        "sleeps": prop_info.sleeps.values,
+        "stars": prop_info.stars.values,
+        "proppostcode": prop_info.postcode.values,
+        "year": booking_years,
+        "bookdate": format_dates(bookdates),
+        "bookdate_scoreboard": format_dates(bookdates),
+        "book_year": bookdates.year.values,
+        "sdate": format_dates(sdates),
+        "fdate": format_dates(fdates),
+        "breakpoint": breakpoints,
+        "zone_name": zone_names,
+        "adults": with_missing(rng, adults, 0.01),
+        "children": with_missing(rng, children, 0.02),
+        "babies": with_missing(rng, rng.binomial(1, 0.1, n), 0.02),
+        "pets": with_missing(rng, rng.binomial(1, 0.15, n), 0.02),
+        "hh_gross": np.round(avg_spend_per_head * adults, 2),
+        "hh_net": np.round(avg_spend_per_head * adults * 0.8, 2),
+        "ho": np.round(avg_spend_per_head * adults * 0.2, 2),
+        "holidayprice": np.round(avg_spend_per_head * (adults + children), 2),
+        "avg_spend_per_head": with_missing(rng, avg_spend_per_head, 0.005),
+        "bighouse": rng.binomial(1, 0.05, n),
+        "burghisland": rng.binomial(1, 0.01, n),
+        "boveycastle": rng.binomial(1, 0.01, n),
+        "sourcecostid": rng.randint(1, 200, n),
+        "sourcedesc": with_missing(rng, [rng.choice(SOURCES[category]) for category in categories], 0.02),
+        "category": with_missing(rng, categories, 0.02),
+        "drivetime": with_missing(rng, rng.randint(1800, 8 * 3600, n), 0.05),
+        "drivedistance": rng.randint(10, 500, n),
+    })
+    assert set(BOOKING_COLS_TO_DROP).issubset(df.columns)
+    return df
+
+
+def generate_property_features(rng, pdf):
+    """ Properties' features in the long format: a row per property, year and feature
+    """
+    features = FEATURES_TO_DROP + YES_NO_COLS + INT_COLS + sorted(CATEGORICAL_COLS)
+    # every feature has its own frequency, every feature is presented at least once
+    mask = rng.random_sample((pdf.shape[0], len(features))) < rng.uniform(0.05, 0.9, len(features))
+    mask[0, :] = True
+    rows, cols = np.nonzero(mask)
+
+    values = np.empty(rows.size, dtype=object)
+    for feature_id, feature in enumerate(features):
+        feature_mask = cols == feature_id
+        n = feature_mask.sum()
+        if feature in YES_NO_COLS:
+            values[feature_mask] = rng.choice(["Yes", "No", "Y", "N"], n, p=[0.6, 0.3, 0.05, 0.05])
+        elif feature in INT_COLS:
+            values[feature_mask] = rng.choice(["0", "1", "1", "2", "3"], n)
+        elif feature in CATEGORICAL_COLS:
+            values[feature_mask] = rng.choice(CATEGORICAL_VALUES[feature], n)
+        else:
+            values[feature_mask] = rng.choice(["Yes", "No", "See description"], n)
+
+    return pd.DataFrame({
+        "propcode": pdf.propcode.values[rows],
+        "year": pdf.year.values[rows],
+        # the raw names are capitalized, the preprocessing lowers them
+        "desc1": [features[col].title() for col in cols],
+        "desc2": values,
+    })
+
+
+def main():
+    rng = np.random.RandomState(args.seed)
+    years = list(range(args.first_year, args.last_year + 1))
+    n_properties = max(int(N_PROPERTIES * args.scale), 20)
+    n_contacts = max(int(N_CONTACTS * args.scale), 100)
+
+    if not os.path.exists(args.output_dir):
+        os.makedirs(args.output_dir)
+
+    logging.info(u"Generating %s properties", n_properties)
+    pdf = generate_properties(rng, n_properties, years)
+
+    logging.info(u"Generating %s contacts", n_contacts)
+    cdf = generate_contacts(rng, n_contacts, years)
+
+    logging.info(u"Generating bookings")
+    bdf = generate_bookings(rng, pdf, cdf.code.values, years)
+    logging.info(u"%s bookings have been generated", bdf.shape[0])
+
+    logging.info(u"Generating properties' features")
+    pfdf = generate_property_features(rng, pdf)
+
+    for name, df in [("booking", bdf), ("contact", cdf), ("property", pdf), ("property_feature", pfdf)]:
+        path = os.path.join(args.output_dir, "%s.csv" % name)
+        logging.info(u"Dumping %s rows to: %s", df.shape[0], path)
+        df.to_csv(path, sep=DELIMITER, index=False)
+    logging.info(u"Finish")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("-o", default='raw', dest="output_dir",
+                        help=u"Path to the output folder. Default: raw")
+    parser.add_argument("--scale", default=1.0, type=float, dest="scale",
+                        help=u"Scale factor of the data size. Default: 1.0")
+    parser.add_argument("--first-year", default=2005, type=int, dest="first_year",
+                        help=u"The first year of the data. Default: 2005")
+    parser.add_argument("--last-year", default=2016, type=int, dest="last_year",
+                        help=u"The last year of the data. Default: 2016")
+    parser.add_argument("-s", default=42, type=int, dest="seed", help=u"Random seed. Default: 42")
+    parser.add_argument("--log-level", default='INFO', dest="log_level",
+                        choices=['DEBUG', 'INFO', 'WARNINGS', 'ERROR'], help=u"Logging level")
+
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format='%(asctime)s %(levelname)s:%(message)s', stream=sys.stdout, level=getattr(logging, args.log_level)
+    )
+
+    main()
@@ -89,14 +89,15 @@ def main():
     testing_df = pd.read_csv(args.testing_csv)[["code", "propcode"]].drop_duplicates()
 
     logging.info("Preparing similarity matrix")
-    sim_m = get_similarity_matrix(tr_m)
+    sim_m = get_similarity_matrix(tr_m, workers=args.workers)
 
     logging.info("Testing hit ratio at top-%s", args.top_k)
     recs_m = get_topk_recs(
         tr_m,
         sim_m,
         binarize(tr_m),
-        args.top_k
+        args.top_k,
+        workers=args.workers
     )
     logging.info(u"Hit ratio: %.3f", hit_ratio(recs_m, testing_df, uid_to_ug, bg_iids))
 
@@ -104,7 +105,8 @@ def main():
         recs_m = get_topk_recs(
             tr_m,
             sim_m,
-            binarize(tr_m)
+            binarize(tr_m),
+            workers=args.workers
         )
         store_data_for_eval(recs_m, testing_df, uid_to_ug, bg_iids)
 
@@ -130,6 +132,10 @@ if __name__ == '__main__':
                         help="Path to the file to store users recommendations for evaluation. Check --ek. "
                              "Default: ui_bg_recs.pkl")
 
+    parser.add_argument("-w", default=1, type=int, dest="workers",
+                        help=u"Number of worker processes building the similarity and recs matrices, "
+                              u"every worker is a forked process sharing the matrices via sharedmem. Default: 1")
+
     parser.add_argument("--log-level", default='INFO', dest="log_level",
                         choices=['DEBUG', 'INFO', 'WARNINGS', 'ERROR'], help=u"Logging level")
 
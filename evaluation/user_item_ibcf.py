@@ -15,7 +15,7 @@ from sklearn.preprocessing import normalize
 
 from ibcf.matrix_functions import get_sparse_matrix_info
 from ibcf.recs import get_topk_recs
-from ibcf.similarity import get_similarity_matrix
+from ibcf.similarity import get_similarity_matrix, DEFAULT_BLOCK_SIZE
 
 
 def get_training_matrix_and_indices(df):
@@ -113,7 +113,15 @@ def main():
     testing_df = pd.read_csv(args.testing_csv)[["code", "propcode"]].drop_duplicates()
 
     logging.info("Preparing similarity matrix")
-    sim_m = get_similarity_matrix(tr_m)
+    sim_m = get_similarity_matrix(
+        tr_m,
+        args.sim_top,
+        args.block_size,
+        args.workers,
+        args.index_factory,
+        args.search_params
+    )
+    logging.info("Similarity matrix: %s", get_sparse_matrix_info(sim_m))
 
     logging.info("Testing hit ratio at top-%s", args.top_k)
     recs_m = get_topk_recs(
@@ -121,6 +129,7 @@ def main():
         sim_m,
         binarize(tr_m),
         args.top_k,
+        workers=args.workers
     )
     logging.info("Hit ratio: %.3f", hit_ratio(recs_m, testing_df, uid_to_row, iid_to_col))
 
@@ -128,7 +137,8 @@ def main():
         recs_m = get_topk_recs(
             tr_m,
             sim_m,
-            binarize(tr_m)
+            binarize(tr_m),
+            workers=args.workers
         )
         store_data_for_eval(recs_m, testing_df, uid_to_row, iid_to_col)
 
@@ -137,6 +147,20 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
     parser.add_argument("-k", default=20, type=int, dest="top_k",
                         help="Number of recommended items per a user. Default: 20")
+    parser.add_argument("--sim-top", default=None, type=int, dest="sim_top",
+                        help="Number of stored similar items per an item. Default: all")
+    parser.add_argument("--block-size", default=DEFAULT_BLOCK_SIZE, type=int, dest="block_size",
+                        help="Number of items whose similarities are computed at once, "
+                             "it bounds the memory. Default: %s" % DEFAULT_BLOCK_SIZE)
+    parser.add_argument("--index", dest="index_factory",
+                        help="faiss index factory string, e.g. IVF256,Flat or HNSW32. If specified, then "
+                             "the similarities are approximated by the index and --sim-top is required. "
+                             "Default: exact similarities")
+    parser.add_argument("--search-params", dest="search_params",
+                        help="faiss search parameters of --index, e.g. nprobe=16 or efSearch=64")
+    parser.add_argument("-w", default=1, type=int, dest="workers",
+                        help="Number of worker processes building the similarity and recs matrices, "
+                              "every worker is a forked process sharing the matrices via sharedmem. Default: 1")
     parser.add_argument("--trf", default='training.csv', dest="training_csv",
                         help="Training data file name. Default: training.csv")
     parser.add_argument("--tsf", default='testing.csv', dest="testing_csv",
@@ -0,0 +1,108 @@
+"""
+Approximate item-item cosine similarities. L2-normalized item vectors are
+indexed by a faiss inner product index and the top neighbours of every item
+are queried by blocks of items.
+"""
+
+import numpy as np
+import faiss
+from scipy.sparse import csr_matrix
+from sklearn.preprocessing import normalize
+
+from ibcf.similarity import DEFAULT_BLOCK_SIZE
+
+# number of item vectors the index is trained on if it needs training
+DEFAULT_TRAIN_SIZE = 50000
+
+
+def _get_dense_block(m, start, block_size):
+    return np.ascontiguousarray(m[start:start + block_size].toarray(), dtype=np.float32)
+
+
+def get_item_vectors(ui_matrix):
+    """ L2-normalized item vectors, their inner products are the cosine similarities
+
+    :param ui_matrix: user (or feature) x item matrix
+    """
+    return normalize(ui_matrix.T.tocsr(), axis=1).astype(np.float32)
+
+
+def build_index(item_vectors, index_factory="Flat", block_size=DEFAULT_BLOCK_SIZE,
+                train_size=DEFAULT_TRAIN_SIZE, seed=42):
+    """ Builds the inner product index of item vectors
+
+    :param item_vectors: item x dimension sparse matrix
+    :param index_factory: faiss index factory string, e.g. "Flat", "IVF256,Flat" or "HNSW32"
+    :param train_size: max number of vectors the index is trained on
+    """
+    n_items, dim = item_vectors.shape
+    index = faiss.index_factory(dim, index_factory, faiss.METRIC_INNER_PRODUCT)
+
+    if not index.is_trained:
+        rows = np.arange(n_items)
+        if n_items > train_size:
+            rows = np.sort(np.random.RandomState(seed).choice(n_items, train_size, replace=False))
+        index.train(_get_dense_block(item_vectors[rows], 0, rows.size))
+
+    for start in range(0, n_items, block_size):
+        index.add(_get_dense_block(item_vectors, start, block_size))
+    return index
+
+
+def search_index(index, item_vectors, top, search_params=None, block_size=DEFAULT_BLOCK_SIZE):
+    """ Queries top neighbours of every item in the index of the same items
+
+    :param search_params: faiss search parameters of the index, e.g. "nprobe=16" or "efSearch=64"
+    :return: item x item csr matrix, the column of an item contains its top similar items
+    like in ibcf.similarity.get_ib_topk_cosine_sim
+    """
+    if top is None or top < 1:
+        raise ValueError("Approximate similarities need top >= 1, got: %s" % top)
+
+    if search_params:
+        faiss.ParameterSpace().set_index_parameters(index, search_params)
+
+    n_items = item_vectors.shape[0]
+    # one more neighbour, the item itself is usually the first one
+    k = min(top + 1, n_items)
+
+    rows, cols, data = [], [], []
+    for start in range(0, n_items, block_size):
+        scores, labels = index.search(_get_dense_block(item_vectors, start, block_size), k)
+        items = np.arange(start, start + labels.shape[0]).reshape(-1, 1)
+
+        # labels are -1 if the index found less than k neighbours
+        mask = (labels != items) & (labels >= 0) & (scores > 0)
+        mask &= np.cumsum(mask, axis=1) <= top
+
+        rows.append(labels[mask])
+        cols.append(np.broadcast_to(items, labels.shape)[mask])
+        data.append(scores[mask])
+
+    if not data:
+        return csr_matrix((0, 0))
+
+    sim_m = csr_matrix(
+        (np.concatenate(data).astype(np.float64), (np.concatenate(rows), np.concatenate(cols))),
+        shape=(n_items, n_items)
+    )
+    sim_m.sort_indices()
+    return sim_m
+
+
+def get_ib_topk_ann_sim(ui_matrix, top, index_factory="Flat", search_params=None,
+                        block_size=DEFAULT_BLOCK_SIZE, workers=1):
+    """ Approximate version of ibcf.similarity.get_ib_topk_cosine_sim
+
+    :param ui_matrix: user (or feature) x item matrix
+    :param top: number of similarities per object in the final matrix
+    :param index_factory: faiss index factory string, "Flat" is the exact search
+    :param search_params: faiss search parameters of the index
+    :param block_size: number of items added to the index and queried at once
+    :param workers: number of faiss threads
+    """
+    faiss.omp_set_num_threads(max(workers, 1))
+
+    item_vectors = get_item_vectors(ui_matrix)
+    index = build_index(item_vectors, index_factory, block_size)
+    return search_index(index, item_vectors, top, search_params, block_size)
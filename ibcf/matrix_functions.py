@@ -2,6 +2,61 @@ import numpy as np
 from scipy.sparse import csr_matrix
 
 
+def _get_kth_per_segment(data, starts, lengths, k):
+    """Finds the k-th largest value of every segment of data
+
+    :param starts: starts of segments
+    :param lengths: lengths of segments, all of them are not less than k
+    """
+    kth = np.empty(starts.size, dtype=data.dtype)
+
+    # segments are padded to the same width and partitioned at once, the padding
+    # is bounded by bucketing segments by the power of 2 of their lengths
+    buckets = np.ceil(np.log2(lengths)).astype(int)
+    for bucket in np.unique(buckets):
+        seg_ids = np.where(buckets == bucket)[0]
+        width = lengths[seg_ids].max()
+        positions = starts[seg_ids][:, None] + np.arange(width)
+        is_padding = np.arange(width) >= lengths[seg_ids][:, None]
+        values = np.where(is_padding, -np.inf, data[np.minimum(positions, data.size - 1)])
+        kth[seg_ids] = -np.partition(-values, k - 1, axis=1)[:, k - 1]
+    return kth
+
+
+def _get_topk_mask(data, lengths, top):
+    """Marks top values of every segment of data, ties are resolved in favour of later values
+
+    :param data: values stored by segments one after another
+    :param lengths: lengths of segments
+    :param top: number of top values per segment
+    :return: boolean mask of values to keep
+    """
+    if top < 1:
+        raise ValueError("top has to be positive: %s" % top)
+
+    seg_ids = np.repeat(np.arange(lengths.size), lengths)
+    # segments that don't exceed top are kept as they are
+    is_long = lengths > top
+    mask = ~is_long[seg_ids]
+
+    long_ids = np.where(is_long)[0]
+    if long_ids.size:
+        starts = np.r_[0, np.cumsum(lengths)[:-1]]
+        kth = np.full(lengths.size, np.inf)
+        kth[long_ids] = _get_kth_per_segment(data, starts[long_ids], lengths[long_ids], top)
+
+        greater = data > kth[seg_ids]
+        mask |= greater
+
+        # only the last values equal to the k-th one fill the rest of the top
+        n_left = top - np.bincount(seg_ids[greater], minlength=lengths.size)
+        equal_ids = np.where(data == kth[seg_ids])[0]
+        equal_seg_ids = seg_ids[equal_ids]
+        rank_from_end = np.searchsorted(equal_seg_ids, equal_seg_ids, side="right") - 1 - np.arange(equal_ids.size)
+        mask[equal_ids[rank_from_end < n_left[equal_seg_ids]]] = True
+    return mask
+
+
 def get_topk(matrix, top, axis=1):
     """Converts source matrix to Top-K matrix
     where each row or column contains only top K values
@@ -11,31 +66,24 @@ def get_topk(matrix, top, axis=1):
     :param axis: 0 - top by column, 1 - top by row
     :return:
     """
-    rows = []
-    cols = []
-    data = []
+    # values are taken in the order of rows and columns, so ties don't depend on the storage order
+    matrix = csr_matrix(matrix, copy=True)
+    matrix.sort_indices()
+    if top is None:
+        return matrix
 
     if axis == 0:
-        matrix = matrix.T.tocsr()
-
-    for row_id, row in enumerate(matrix):
-        if top is not None and row.nnz > top:
-            top_args = np.argsort(row.data)[-top:]
-
-            rows += [row_id] * top
-            cols += row.indices[top_args].tolist()
-            data += row.data[top_args].tolist()
-        elif row.nnz > 0:
-            rows += [row_id] * row.nnz
-            cols += row.indices.tolist()
-            data += row.data.tolist()
-
-    topk_m = csr_matrix((data, (rows, cols)), (matrix.shape[0], matrix.shape[1]))
-
-    if axis == 0:
-        topk_m = topk_m.T.tocsr()
-
-    return topk_m
+        # values of columns are brought together by a stable sorting of column indices,
+        # so the matrix isn't transposed and values of a column keep the order of rows
+        order = np.argsort(matrix.indices, kind="mergesort")
+        lengths = np.bincount(matrix.indices, minlength=matrix.shape[1])
+        mask = np.empty(matrix.nnz, dtype=bool)
+        mask[order] = _get_topk_mask(matrix.data[order], lengths, top)
+    else:
+        mask = _get_topk_mask(matrix.data, np.diff(matrix.indptr), top)
+
+    indptr = np.r_[0, np.cumsum(mask)][matrix.indptr]
+    return csr_matrix((matrix.data[mask], matrix.indices[mask], indptr), shape=matrix.shape)
 
 
 def get_top_from_row(row, top=None):
@@ -0,0 +1,46 @@
+"""
+Computation of sparse matrices by blocks in several processes. Input matrices
+are copied to shared memory once, worker processes forked by sharedmem read
+them directly and only the resulting blocks are sent back. sharedmem is
+needed only if there are several workers.
+"""
+
+# more blocks than workers balance the load better
+BLOCKS_PER_WORKER = 4
+
+
+def share_matrix(m):
+    """ Copies arrays of a CSR or CSC matrix to shared memory
+    """
+    import sharedmem
+
+    if m is None:
+        return None
+    return type(m)((sharedmem.copy(m.data), sharedmem.copy(m.indices), sharedmem.copy(m.indptr)), shape=m.shape)
+
+
+def get_blocks(n, block_size, workers=1):
+    """ Splits n rows into blocks, the blocks are made smaller to give every worker several of them
+
+    :return: starts of the blocks and the block size
+    """
+    if workers > 1:
+        block_size = min(block_size, -(-n // (workers * BLOCKS_PER_WORKER)))
+    block_size = max(block_size, 1)
+    return list(range(0, n, block_size)), block_size
+
+
+def map_blocks(func, starts, workers=1):
+    """ Computes func(start) for every block, the blocks are computed by
+    worker processes if workers > 1
+
+    :return: list of results in the order of starts
+    """
+    if workers <= 1 or len(starts) <= 1:
+        return [func(start) for start in starts]
+
+    import sharedmem
+
+    with sharedmem.MapReduce(np=workers) as pool:
+        return pool.map(func, starts)
+
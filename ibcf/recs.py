@@ -2,11 +2,75 @@
 Methods for item-based top-k CF recommendations
 """
 
+import numpy as np
+from scipy.sparse import csr_matrix, vstack
 from sklearn.preprocessing import binarize
 from ibcf.matrix_functions import get_topk
+from ibcf.parallel import share_matrix, get_blocks, map_blocks
 
+# number of users whose recs are scored at once
+DEFAULT_CHUNK_SIZE = 1024
 
-def get_topk_recs(ui_vector, sim_matrix, e_matrix=None, top=None):
+
+def _exclude(recs_m, e_matrix):
+    """ Removes the user-item pairs of e_matrix from recs_m with sorted indices
+    """
+    n_cols = recs_m.shape[1]
+    recs_rows = np.repeat(np.arange(recs_m.shape[0], dtype=np.int64), np.diff(recs_m.indptr))
+    e_rows = np.repeat(np.arange(e_matrix.shape[0], dtype=np.int64), np.diff(e_matrix.indptr))
+
+    # keys of recs are sorted, so the excluded pairs are found by the binary search
+    recs_keys = recs_rows * n_cols + recs_m.indices
+    e_keys = (e_rows * n_cols + e_matrix.indices)[e_matrix.data != 0]
+    pos = np.searchsorted(recs_keys, e_keys)
+    found = pos < recs_keys.size
+    pos, e_keys = pos[found], e_keys[found]
+    recs_m.data[pos[recs_keys[pos] == e_keys]] = 0
+    recs_m.eliminate_zeros()
+    return recs_m
+
+
+def _get_chunk_recs(ui_chunk, sim_matrix, e_chunk=None, top=None):
+    n_users = ui_chunk.shape[0]
+
+    # enumerator and denominator are computed by one product,
+    # this order of dot production is obligatory
+    both_m = vstack([ui_chunk, binarize(ui_chunk)], format="csr").dot(sim_matrix).tocsr()
+    recs_m = both_m[:n_users]
+    recs_denom = both_m[n_users:]
+
+    recs_m.data = recs_m.data / recs_denom.data  # normalised score
+    recs_m.sort_indices()
+
+    if e_chunk is not None:
+        recs_m = _exclude(recs_m, e_chunk)
+    return get_topk(recs_m, top) if top is not None else recs_m
+
+
+def _get_topk_recs(ui_vector, sim_matrix, e_matrix=None, top=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """ Scores users by chunks and keeps only top recs of a chunk before scoring the next one
+    """
+    ui_vector = csr_matrix(ui_vector)
+    sim_matrix = csr_matrix(sim_matrix)
+    e_matrix = csr_matrix(e_matrix) if e_matrix is not None else None
+
+    n_users = ui_vector.shape[0]
+    chunk_size = max(chunk_size, 1)
+    chunks = [
+        _get_chunk_recs(
+            ui_vector[start:start + chunk_size],
+            sim_matrix,
+            e_matrix[start:start + chunk_size] if e_matrix is not None else None,
+            top
+        )
+        for start in range(0, n_users, chunk_size)
+    ]
+    if not chunks:
+        return csr_matrix((n_users, sim_matrix.shape[1]))
+    return vstack(chunks, format="csr")
+
+
+def get_topk_recs(ui_vector, sim_matrix, e_matrix=None, top=None, workers=1, chunk_size=DEFAULT_CHUNK_SIZE):
     """
     Getting top recommendations for user with some history
 
@@ -14,14 +78,29 @@ def get_topk_recs(ui_vector, sim_matrix, e_matrix=None, top=None):
     :param sim_matrix: similarity matrix
     :param e_matrix: user-item pairs that should be excluded from recs (binary matrix)
     :param top: number of recommendations
+    :param workers: number of processes computing blocks of users
+    :param chunk_size: number of users scored at once, only top recs of every chunk
+    are kept, so the memory is bounded by the chunk size and top
     :return:
     """
-    # this order of dot production is obligatory
-    recs_row = ui_vector.dot(sim_matrix) # enumerator
-    recs_denom = binarize(ui_vector).dot(sim_matrix)  # denominator
+    if workers <= 1:
+        return _get_topk_recs(ui_vector, sim_matrix, e_matrix, top, chunk_size)
 
-    recs_row.data = recs_row.data / recs_denom.data  # normalised score
+    ui_m = share_matrix(csr_matrix(ui_vector))
+    sim_matrix = share_matrix(csr_matrix(sim_matrix))
+    e_matrix = share_matrix(csr_matrix(e_matrix)) if e_matrix is not None else None
 
-    if e_matrix is not None:
-        recs_row = recs_row - recs_row.multiply(e_matrix)
-    return get_topk(recs_row, top) if top is not None else recs_row
+    starts, block_size = get_blocks(ui_m.shape[0], ui_m.shape[0], workers)
+    if not starts:
+        return csr_matrix((0, sim_matrix.shape[1]))
+    blocks = map_blocks(
+        lambda start: _get_topk_recs(
+            ui_m[start:start + block_size],
+            sim_matrix,
+            e_matrix[start:start + block_size] if e_matrix is not None else None,
+            top,
+            chunk_size
+        ),
+        starts, workers
+    )
+    return vstack(blocks, format="csr")
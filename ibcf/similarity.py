@@ -1,26 +1,71 @@
+import numpy as np
+from scipy.sparse import csr_matrix, hstack
 from sklearn.preprocessing import normalize
-from ibcf.matrix_functions import nullify_main_diagonal, get_topk
+from ibcf.matrix_functions import get_topk
+from ibcf.parallel import share_matrix, get_blocks, map_blocks
 
+# number of items whose similarities are computed at once
+DEFAULT_BLOCK_SIZE = 1024
 
-def get_ib_topk_cosine_sim(ui_matrix, top=None):
+
+def _get_block_sim(iu_norm_m, ui_norm_block_m, start, top=None):
+    """ Similarities of all items to a block of items without self-similarities
+
+    :param ui_norm_block_m: columns of the block of items
+    :param start: the first item of the block
+    """
+    block_m = iu_norm_m.dot(ui_norm_block_m).tocsr()
+
+    # the diagonal of the whole matrix is shifted by start in the block
+    rows = np.repeat(np.arange(block_m.shape[0]), np.diff(block_m.indptr))
+    block_m.data[rows == block_m.indices + start] = 0
+    block_m.eliminate_zeros()
+
+    if top is not None:
+        block_m = get_topk(block_m, top, axis=0)
+    # sorted indices make the result independent of the blocks
+    block_m.sort_indices()
+    return block_m
+
+
+def get_ib_topk_cosine_sim(ui_matrix, top=None, block_size=DEFAULT_BLOCK_SIZE, workers=1):
     """
     The method builds item-item cosine similarity matrix
     according to: http://dl.acm.org/citation.cfm?id=963776
 
+    Similarities are computed by blocks of items and every block is pruned to top
+    right away, so the memory is bounded by the block size and top
+
     :param ui_matrix: user x item matrix
     :param top: number of similarities per object in the final matrix
+    :param block_size: number of items whose similarities are computed at once
+    :param workers: number of processes computing the blocks
     """
-    iu_m = ui_matrix.T.tocsr()
-    iu_norm_m = normalize(iu_m, axis=1)
+    iu_norm_m = normalize(ui_matrix.T.tocsr(), axis=1)
+    ui_norm_m = iu_norm_m.T.tocsc()
 
-    sim_m = iu_norm_m.dot(iu_norm_m.T)
-    sim_m = nullify_main_diagonal(sim_m)
+    n_items = iu_norm_m.shape[0]
+    if not n_items:
+        return csr_matrix((0, 0))
 
-    if top is not None:
-        sim_m = get_topk(sim_m, top, axis=0)
+    if workers > 1:
+        iu_norm_m, ui_norm_m = share_matrix(iu_norm_m), share_matrix(ui_norm_m)
 
-    return sim_m
+    starts, block_size = get_blocks(n_items, block_size, workers)
+    blocks = map_blocks(
+        lambda start: _get_block_sim(iu_norm_m, ui_norm_m[:, start:start + block_size], start, top),
+        starts, workers
+    )
+    return hstack(blocks, format="csr")
 
 
-def get_similarity_matrix(ui_matrix, top=None):
-    return get_ib_topk_cosine_sim(ui_matrix, top)
+def get_similarity_matrix(ui_matrix, top=None, block_size=DEFAULT_BLOCK_SIZE, workers=1,
+                          index_factory=None, search_params=None):
+    """ Exact similarities or, if index_factory is set, approximate ones
+    computed by the faiss index, see ibcf.ann_similarity
+    """
+    if index_factory is not None:
+        # faiss is needed only by the approximate mode
+        from ibcf.ann_similarity import get_ib_topk_ann_sim
+        return get_ib_topk_ann_sim(ui_matrix, top, index_factory, search_params, block_size, workers)
+    return get_ib_topk_cosine_sim(ui_matrix, top, block_size, workers)
@@ -5,20 +5,27 @@ def get_ug_data(ug_file_path):
     :param ug_file_path: a path to the file containing information about user clusters
     :return: uid -> ug_id index
     """
+    with open(ug_file_path) as f:
+        return parse_ug_data(f)
+
+
+def parse_ug_data(lines):
+    """ The same as get_ug_data, but for lines of the file
+    """
     uid_to_ug = {}
+    lines = iter(lines)
 
-    with open(ug_file_path) as f:
-        # skipping
-        while not next(f).startswith("Cluster"):
-            pass
-
-        cl_id = 0
-        for line in f:
-            if line.startswith("Users:"):
-                for uid in line.lstrip("Users:").split(","):
-                    uid_to_ug[uid.strip()] = cl_id
-            elif line.startswith("Cluster"):
-                cl_id += 1
+    # skipping
+    while not next(lines).startswith("Cluster"):
+        pass
+
+    cl_id = 0
+    for line in lines:
+        if line.startswith("Users:"):
+            for uid in line.lstrip("Users:").split(","):
+                uid_to_ug[uid.strip()] = cl_id
+        elif line.startswith("Cluster"):
+            cl_id += 1
     return uid_to_ug
 
 
@@ -32,23 +39,30 @@ def get_bg_data(bg_file_path):
     :param bg_file_path: a path to the file containing information about booking clusters
     :return: bid -> {bg_id1, bg_id2, ...} and bg_id -> {iid1, iid2, ...} indices
     """
+    with open(bg_file_path) as f:
+        return parse_bg_data(f)
+
+
+def parse_bg_data(lines):
+    """ The same as get_bg_data, but for lines of the file
+    """
     bid_to_bgs = {}
     bg_iids = {}
+    lines = iter(lines)
 
-    with open(bg_file_path) as f:
-        # skipping
-        while not next(f).startswith("Cluster"):
-            pass
-
-        cl_id = 0
-        for line in f:
-            if line.startswith("Bookings:"):
-                for bid in line.lstrip("Bookings:").split(","):
-                    bid_to_bgs[bid.strip()] = cl_id
-            elif line.startswith("Items:"):
-                bg_iids[cl_id] = {iid.strip() for iid in line.lstrip("Items:").split(",")}
-            elif line.startswith("Cluster"):
-                cl_id += 1
+    # skipping
+    while not next(lines).startswith("Cluster"):
+        pass
+
+    cl_id = 0
+    for line in lines:
+        if line.startswith("Bookings:"):
+            for bid in line.lstrip("Bookings:").split(","):
+                bid_to_bgs[bid.strip()] = cl_id
+        elif line.startswith("Items:"):
+            bg_iids[cl_id] = {iid.strip() for iid in line.lstrip("Items:").split(",")}
+        elif line.startswith("Cluster"):
+            cl_id += 1
     return bid_to_bgs, bg_iids
 
 
@@ -58,20 +72,27 @@ def get_group_features(file_path):
     :param file_path: a path to the file containing information about clusters
     :return: dict {ug_id_1: {feature_id_1: score_1, ...}, ...}
     """
+    with open(file_path) as f:
+        return parse_group_features(f)
+
+
+def parse_group_features(lines):
+    """ The same as get_group_features, but for lines of the file
+    """
     group_features = {}
+    lines = iter(lines)
 
-    with open(file_path) as f:
-        # skipping
-        while not next(f).startswith("Cluster"):
-            pass
-
-        cl_id = 0
-        for line in f:
-            if line.startswith("->"):
-                feature, score = list(map(lambda x: x.strip(), line.lstrip("->").split(": ")))
-                score = float(score)
-                group_features.setdefault(cl_id, {})
-                group_features[cl_id][feature] = score
-            elif line.startswith("Cluster"):
-                cl_id += 1
+    # skipping
+    while not next(lines).startswith("Cluster"):
+        pass
+
+    cl_id = 0
+    for line in lines:
+        if line.startswith("->"):
+            feature, score = list(map(lambda x: x.strip(), line.lstrip("->").split(": ")))
+            score = float(score)
+            group_features.setdefault(cl_id, {})
+            group_features[cl_id][feature] = score
+        elif line.startswith("Cluster"):
+            cl_id += 1
     return group_features
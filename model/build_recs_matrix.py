@@ -63,10 +63,10 @@ def main():
     logging.info(u"Training matrix: %s", get_sparse_matrix_info(ui_m))
 
     logging.info(u"Building similarity matrix")
-    sim_m = get_similarity_matrix(ui_m)
+    sim_m = get_similarity_matrix(ui_m, workers=args.workers)
 
     logging.info(u"Building ug-bg recs matrix")
-    recs_m = get_topk_recs(ui_m, sim_m)
+    recs_m = get_topk_recs(ui_m, sim_m, workers=args.workers)
 
     logging.info(u"Dumping recs matrix")
     mmwrite(args.recs_path, recs_m)
@@ -84,6 +84,9 @@ if __name__ == '__main__':
     parser.add_argument("-o", default='ug_bg_recs.mtx', dest="recs_path",
                         help=u"Path to the output file for the recommendation matrix. "
                              u"Default: ug_bg_recs.mtx")
+    parser.add_argument("-w", default=1, type=int, dest="workers",
+                        help=u"Number of worker processes building the similarity and recs matrices, "
+                              u"every worker is a forked process sharing the matrices via sharedmem. Default: 1")
     parser.add_argument("--log-level", default='INFO', dest="log_level",
                         choices=['DEBUG', 'INFO', 'WARNINGS', 'ERROR'], help=u"Logging level")
 
@@ -0,0 +1,47 @@
+"""
+The script compiles the data used by the recommendation server into one
+binary model bundle. Set MODEL_BUNDLE_PATH in the server config to the
+resulting file to start the server from the bundle.
+"""
+
+import argparse
+import logging
+import os
+import sys
+from datetime import datetime
+
+from flask import Config
+
+from server.model import Model
+
+
+def main():
+    config = Config(os.getcwd())
+    config.from_pyfile(os.path.abspath(args.config_path))
+
+    logging.info(u"Loading model from the raw sources")
+    model = Model.load(config, args.version)
+
+    logging.info(u"Dumping model %s to: %s", model.version, args.bundle_path)
+    model.dump(args.bundle_path)
+    logging.info(u"Finish")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("-c", required=True, dest="config_path",
+                        help=u"Path to a server config file listing the raw sources")
+    parser.add_argument("-o", default='model.npz', dest="bundle_path",
+                        help=u"Path to the output bundle. Default: model.npz")
+    parser.add_argument("-v", default=datetime.utcnow().strftime("%Y%m%d%H%M%S"), dest="version",
+                        help=u"Model version. Default: current UTC time, e.g. 20170101120000")
+    parser.add_argument("--log-level", default='INFO', dest="log_level",
+                        choices=['DEBUG', 'INFO', 'WARNINGS', 'ERROR'], help=u"Logging level")
+
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format='%(asctime)s %(levelname)s:%(message)s', stream=sys.stdout, level=getattr(logging, args.log_level)
+    )
+
+    main()
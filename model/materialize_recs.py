@@ -0,0 +1,91 @@
+"""
+The script precomputes responses of /api/cluster/recs/ and /api/item/recs/
+with default arguments for every known user of a model bundle. Set
+RECS_STORE_PATH in the server config to the resulting file to answer
+such requests by a lookup.
+"""
+
+import argparse
+import logging
+import multiprocessing
+import sys
+
+from server.api import DEFAULT_TOP_CLUSTERS, DEFAULT_TOP_ITEMS
+from server.api.views import get_cluster_based_results, get_content_based_results
+from server.app import APIApp
+from server.model import Model
+from server.recs_store import CLUSTER_RECS, ITEM_RECS, save_recs_store
+
+_model = None
+
+
+def _init_worker(bundle_path):
+    global _model
+    # the arrays of the bundle are shared by all workers
+    _model = Model.load_bundle(bundle_path, mmap_arrays=True)
+
+
+def _dump_results(results):
+    return {uid: APIApp.dump_json({"result": res}).encode("utf-8") for uid, res in results.items() if res}
+
+
+def _materialize_chunk(args):
+    endpoint, uids = args
+    if endpoint == CLUSTER_RECS:
+        results = get_cluster_based_results(_model, uids, DEFAULT_TOP_CLUSTERS, DEFAULT_TOP_ITEMS)
+    else:
+        results = get_content_based_results(_model, uids, DEFAULT_TOP_ITEMS)
+    return endpoint, _dump_results(results)
+
+
+def get_chunks(uids, chunk_size):
+    return [uids[i:i + chunk_size] for i in range(0, len(uids), chunk_size)]
+
+
+def main():
+    logging.info(u"Loading model from: %s", args.bundle_path)
+    model = Model.load_bundle(args.bundle_path, mmap_arrays=True)
+
+    tasks = [(CLUSTER_RECS, chunk) for chunk in get_chunks(model.user_dp.get_uids(), args.chunk_size)]
+    tasks += [(ITEM_RECS, chunk) for chunk in get_chunks(model.item_feature_dp.get_uids(), args.chunk_size)]
+    logging.info(u"Materializing recs in %s chunks by %s workers", len(tasks), args.workers)
+
+    endpoint_payloads = {CLUSTER_RECS: {}, ITEM_RECS: {}}
+    pool = multiprocessing.Pool(args.workers, initializer=_init_worker, initargs=(args.bundle_path,))
+    try:
+        for i, (endpoint, payloads) in enumerate(pool.imap_unordered(_materialize_chunk, tasks), 1):
+            endpoint_payloads[endpoint].update(payloads)
+            logging.debug(u"%s/%s chunks have been materialized", i, len(tasks))
+    finally:
+        pool.close()
+        pool.join()
+
+    for endpoint, payloads in endpoint_payloads.items():
+        logging.info(u"Endpoint %s: %s responses, %s bytes",
+                     endpoint, len(payloads), sum(len(p) for p in payloads.values()))
+
+    logging.info(u"Dumping recs of model %s to: %s", model.version, args.store_path)
+    save_recs_store(args.store_path, model.version, endpoint_payloads)
+    logging.info(u"Finish")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("-m", required=True, dest="bundle_path",
+                        help=u"Path to the model bundle built by model/compile_model.py")
+    parser.add_argument("-o", default='recs.npz', dest="store_path",
+                        help=u"Path to the output recs store. Default: recs.npz")
+    parser.add_argument("-w", default=multiprocessing.cpu_count(), type=int, dest="workers",
+                        help=u"Number of worker processes. Default: number of CPUs")
+    parser.add_argument("--chunk-size", default=1000, type=int, dest="chunk_size",
+                        help=u"Number of users processed by a worker at once. Default: 1000")
+    parser.add_argument("--log-level", default='INFO', dest="log_level",
+                        choices=['DEBUG', 'INFO', 'WARNINGS', 'ERROR'], help=u"Logging level")
+
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format='%(asctime)s %(levelname)s:%(message)s', stream=sys.stdout, level=getattr(logging, args.log_level)
+    )
+
+    main()
@@ -10,6 +10,8 @@ def get_app(config_path=None):
     api_app = APIApp(__name__)
     api_app.init(config_path)
     api_app.setup_error_handlers()
+    api_app.setup_request_metrics()
+    api_app.setup_profiling()
     api_app.register_blueprint(api_bp)
     return api_app
 
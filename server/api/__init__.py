@@ -1,9 +1,13 @@
 import logging
 
-from flask import Blueprint, request
+from flask import Blueprint, current_app, request
 
-from server.api.views import get_cluster_based_recs, get_content_based_recs
-from server.exceptions import ArgErrorException
+from server.api.views import get_cluster_based_recs, get_content_based_recs, \
+    get_cluster_based_recs_batch, get_content_based_recs_batch
+from server.exceptions import ArgErrorException, AccessDeniedException, ModelReloadInProgressException
+from server.functions import is_admin_request
+from server.metrics import REGISTRY, RECS_STORE_LOOKUPS, format_family
+from server.recs_store import CLUSTER_RECS, ITEM_RECS
 
 api_bp = Blueprint('api_bp', __name__, url_prefix='/api')
 logger = logging.getLogger(__name__)
@@ -13,11 +17,118 @@ DEFAULT_TOP_CLUSTERS = 3
 DEFAULT_TOP_ITEMS = 5
 
 
+def get_batch_args():
+    """Parses the JSON body of batch calls: {"uids": [uid1, ...], <arg>: <value>, ...}
+    """
+    data = request.get_json(force=True, silent=True)
+    if not isinstance(data, dict):
+        raise ArgErrorException("body", "JSON object has to be posted")
+
+    uids = data.get("uids")
+    if not isinstance(uids, list) or not all(isinstance(uid, str) for uid in uids):
+        raise ArgErrorException("uids", "argument has to be a list of uids")
+
+    max_batch_size = current_app.config.get('MAX_BATCH_SIZE')
+    if max_batch_size and len(uids) > max_batch_size:
+        raise ArgErrorException("uids", "too many uids", max_batch_size=max_batch_size)
+    return uids, data
+
+
+def get_int_batch_arg(data, arg_name, default):
+    value = data.get(arg_name, default)
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise ArgErrorException(arg_name, "argument has to be an integer")
+    return value
+
+
+def get_stored_response(model, endpoint, uid):
+    """Returns the precomputed JSON response or None
+
+    :param model: the model in use by the request
+    """
+    store = current_app.recs_store
+    if store is None or store.version != model.version:
+        return None
+
+    response = store.get(endpoint, uid)
+    RECS_STORE_LOOKUPS.labels("miss" if response is None else "hit").inc()
+    return response
+
+
+def get_cached_response(model, key, get_result):
+    """Returns the JSON response cached by (key, model version) or computes and caches it
+
+    :param model: the model in use by the request, the model app.model points
+        to can be swapped by a reload meanwhile
+    :param get_result: function computing the result by the model
+    """
+    cache = current_app.recs_cache
+    if cache is None:
+        return get_result(model)
+
+    key += (model.version,)
+    response = cache.get(key)
+    if response is None:
+        # bytes are cached, so the size of the cache is measured in bytes
+        response = current_app.encode_response(get_result(model)).encode("utf-8")
+        cache.set(key, response)
+    return response
+
+
 @api_bp.route('/ping/')
 def ping_handler():
     """Ping-pong command
     """
-    return {"result": "pong"}
+    return {"result": "pong", "model_version": current_app.model.version}
+
+
+@api_bp.route('/admin/reload/', methods=['POST'])
+def reload_handler():
+    """Reloads the model in the background, the current model serves
+    requests until the new one is ready. Only the model of the worker
+    process serving the call is reloaded
+    """
+    if not is_admin_request(current_app.config, request.headers):
+        raise AccessDeniedException()
+
+    wait = request.args.get("wait", type=int, default=0)
+    if not current_app.model_reloader.reload(wait=bool(wait)):
+        raise ModelReloadInProgressException()
+    return {"result": "reloaded" if wait else "started", "model_version": current_app.model.version}
+
+
+@api_bp.route('/cache/stats/')
+def cache_stats_handler():
+    """Counters of the recs cache
+    """
+    cache = current_app.recs_cache
+    return {"result": cache.stats() if cache is not None else None}
+
+
+@api_bp.route('/metrics/')
+def metrics_handler():
+    """Metrics of the worker in the Prometheus text format
+    """
+    lines = REGISTRY.render()
+    lines.extend(format_family(
+        "model_info", "gauge", "Version of the model in use",
+        [("", ("version",), (current_app.model.version,), 1)]
+    ))
+
+    cache = current_app.recs_cache
+    if cache is not None:
+        stats = cache.stats()
+        for name in ("hits", "misses", "evictions", "expirations"):
+            lines.extend(format_family(
+                "recs_cache_%s_total" % name, "counter", "Number of %s of the recs cache" % name,
+                [("", (), (), stats[name])]
+            ))
+        for name in ("entries", "bytes"):
+            lines.extend(format_family(
+                "recs_cache_%s" % name, "gauge", "Number of %s in the recs cache" % name,
+                [("", (), (), stats[name])]
+            ))
+    return current_app.response_class("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
 
 
 @api_bp.route('/cluster/recs/')
@@ -28,7 +139,17 @@ def cluster_recs_handler():
 
     top_clusters = request.args.get("top", type=int, default=DEFAULT_TOP_CLUSTERS)
     top_items = request.args.get("top_items", type=int, default=DEFAULT_TOP_ITEMS)
-    return get_cluster_based_recs(uid, top_clusters, top_items)
+    model = current_app.model
+    if top_clusters == DEFAULT_TOP_CLUSTERS and top_items == DEFAULT_TOP_ITEMS:
+        response = get_stored_response(model, CLUSTER_RECS, uid)
+        if response is not None:
+            return response
+
+    return get_cached_response(
+        model,
+        (CLUSTER_RECS, uid, top_clusters, top_items),
+        lambda m: get_cluster_based_recs(m, uid, top_clusters, top_items)
+    )
 
 
 @api_bp.route('/item/recs/')
@@ -38,4 +159,33 @@ def item_recs_handler():
         raise ArgErrorException("uid", "argument has to be specified")
 
     top_items = request.args.get("top", type=int, default=DEFAULT_TOP_ITEMS)
-    return get_content_based_recs(uid, top_items)
+    model = current_app.model
+    if top_items == DEFAULT_TOP_ITEMS:
+        response = get_stored_response(model, ITEM_RECS, uid)
+        if response is not None:
+            return response
+
+    return get_cached_response(
+        model,
+        (ITEM_RECS, uid, None, top_items),
+        lambda m: get_content_based_recs(m, uid, top_items)
+    )
+
+
+@api_bp.route('/cluster/recs/batch/', methods=['POST'])
+def cluster_recs_batch_handler():
+    """Cluster based recs for several users: {"result": {uid: <the same as /cluster/recs/>, ...}}
+    """
+    uids, data = get_batch_args()
+    top_clusters = get_int_batch_arg(data, "top", DEFAULT_TOP_CLUSTERS)
+    top_items = get_int_batch_arg(data, "top_items", DEFAULT_TOP_ITEMS)
+    return get_cluster_based_recs_batch(uids, top_clusters, top_items)
+
+
+@api_bp.route('/item/recs/batch/', methods=['POST'])
+def item_recs_batch_handler():
+    """Content based recs for several users: {"result": {uid: <the same as /item/recs/>, ...}}
+    """
+    uids, data = get_batch_args()
+    top_items = get_int_batch_arg(data, "top", DEFAULT_TOP_ITEMS)
+    return get_content_based_recs_batch(uids, top_items)
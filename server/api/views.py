@@ -1,35 +1,115 @@
-from flask import current_app as app
+from flask import current_app as app, request
 
+from server.metrics import StageTimer, NullStageTimer
+from server.recommender import BATCH_CHUNK_SIZE
 
-def get_cluster_based_recs(uid, top_clusters, top_items):
+
+def _prepare_cluster_based_result(model, uid, ug_id, recs):
+    for bg_rec in recs:
+        bg_rec["features"] = model.booking_dp.get_cluster_features(bg_rec["bg_id"])
+
+    return {
+        "user": model.user_dp.get_uid_features(uid),
+        "user_cluster": {ug_id: model.user_dp.get_cluster_features(ug_id)},
+        "recs": recs,
+        "prev_bookings_summary": model.booking_dp.get_uid_booking_summary(uid),
+    }
+
+
+def _prepare_content_based_result(model, uid, recs):
+    return {
+        "user": model.user_dp.get_uid_features(uid),
+        "recs": recs,
+        "prev_bookings_summary": model.booking_dp.get_uid_booking_summary(uid),
+    }
+
+
+def get_cluster_based_recs(model, uid, top_clusters, top_items):
+    timer = StageTimer(request.endpoint)
     res = {}
-    ug_id = app.user_dp.get_cluster_id(uid)
+    ug_id = model.user_dp.get_cluster_id(uid)
+    timer.lap("cluster_lookup")
 
     if ug_id is not None:
-        iid_recs = app.item_pop_recommender.get_recs(uid)
-        bg_recs = app.bg_recommender.get_recs(ug_id, iid_recs, top_clusters, top_items)
-        recs = app.item_dp.prepare_bg_recs(bg_recs, iid_recs, top_items=top_items)
-        for bg_rec in recs:
-            bg_rec["features"] = app.booking_dp.get_cluster_features(bg_rec["bg_id"])
-
-        res = {
-            "user": app.user_dp.get_uid_features(uid),
-            "user_cluster": {ug_id: app.user_dp.get_cluster_features(ug_id)},
-            "recs": recs,
-            "prev_bookings_summary": app.booking_dp.get_uid_booking_summary(uid),
-        }
+        booked_cols = model.booking_dp.get_iid_cols_for_uid(uid)
+        timer.lap("booked_items")
+        bg_ids, bg_scores = model.bg_recommender.get_recs(ug_id, booked_cols, top_clusters, top_items)
+        timer.lap("cluster_recs")
+        recs = model.item_dp.prepare_bg_recs(bg_ids, bg_scores, booked_cols, top_items=top_items)
+        timer.lap("item_recs")
+        res = _prepare_cluster_based_result(model, uid, ug_id, recs)
+        timer.lap("features")
     return {"result": res}
 
 
-def get_content_based_recs(uid, top_items):
+def get_cluster_based_results(model, uids, top_clusters, top_items, timer=None):
+    """Returns {uid: <result of /cluster/recs/>, ...} computed by the model,
+    results of unknown uids are empty
+    """
+    timer = timer or NullStageTimer()
+    res = {uid: {} for uid in uids}
+
+    ug_ids = [model.user_dp.get_cluster_id(uid) for uid in uids]
+    known = [(uid, ug_id) for uid, ug_id in zip(uids, ug_ids) if ug_id is not None]
+    timer.lap("cluster_lookup")
+
+    for start in range(0, len(known), BATCH_CHUNK_SIZE):
+        known_uids, known_ug_ids = zip(*known[start:start + BATCH_CHUNK_SIZE])
+        booked_m = model.booking_dp.get_iid_cols_matrix(known_uids, model.item_dp.n_iids)
+        timer.lap("booked_items")
+        bg_indptr, bg_ids, bg_scores = model.bg_recommender.get_recs_batch(
+            known_ug_ids, booked_m, top_clusters, top_items
+        )
+        timer.lap("cluster_recs")
+        recs_per_uid = model.item_dp.prepare_bg_recs_batch(bg_indptr, bg_ids, bg_scores, booked_m, top_items)
+        timer.lap("item_recs")
+
+        for uid, ug_id, recs in zip(known_uids, known_ug_ids, recs_per_uid):
+            res[uid] = _prepare_cluster_based_result(model, uid, ug_id, recs)
+        timer.lap("results")
+    return res
+
+
+def get_cluster_based_recs_batch(uids, top_clusters, top_items):
+    timer = StageTimer(request.endpoint)
+    return {"result": get_cluster_based_results(app.model, uids, top_clusters, top_items, timer)}
+
+
+def get_content_based_recs(model, uid, top_items):
+    timer = StageTimer(request.endpoint)
     res = {}
-    if app.item_feature_dp.has_uid_features(uid):
-        iid_recs = app.item_cb_recommender.get_recs(uid, top_items)
-        recs = app.item_dp.prepare_iid_recs(iid_recs)
-
-        res = {
-            "user": app.user_dp.get_uid_features(uid),
-            "recs": recs,
-            "prev_bookings_summary": app.booking_dp.get_uid_booking_summary(uid),
-        }
+    has_uid_features = model.item_feature_dp.has_uid_features(uid)
+    timer.lap("user_lookup")
+
+    if has_uid_features:
+        iid_recs = model.item_cb_recommender.get_recs(uid, top_items)
+        timer.lap("item_scores")
+        recs = model.item_dp.prepare_iid_recs(iid_recs)
+        timer.lap("item_recs")
+        res = _prepare_content_based_result(model, uid, recs)
+        timer.lap("features")
     return {"result": res}
+
+
+def get_content_based_results(model, uids, top_items, timer=None):
+    """Returns {uid: <result of /item/recs/>, ...} computed by the model,
+    results of unknown uids are empty
+    """
+    timer = timer or NullStageTimer()
+    res = {uid: {} for uid in uids}
+
+    known_uids = [uid for uid in uids if model.item_feature_dp.has_uid_features(uid)]
+    timer.lap("user_lookup")
+    iid_recs_m = model.item_cb_recommender.get_recs_batch(known_uids, top_items)
+    timer.lap("item_scores")
+    recs_per_uid = model.item_dp.prepare_iid_recs_batch(iid_recs_m)
+    timer.lap("item_recs")
+    for uid, recs in zip(known_uids, recs_per_uid):
+        res[uid] = _prepare_content_based_result(model, uid, recs)
+    timer.lap("results")
+    return res
+
+
+def get_content_based_recs_batch(uids, top_items):
+    timer = StageTimer(request.endpoint)
+    return {"result": get_content_based_results(app.model, uids, top_items, timer)}
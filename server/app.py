@@ -1,14 +1,18 @@
 import json
 import logging
 import logging.config
+import os
+import time
 
 import numpy as np
-from flask import Flask, jsonify
+from flask import Flask, jsonify, g, request
 
-from server.data_provider import UserDataProvider, BookingDataProvider, ItemDataProvider, ItemFeatureDataProvider
-from server.exceptions import BaseApiException
-from server.functions import get_abs_path, clean_json_dict_keys
-from server.recommender import ClusterRecommender, PopItemRecommender, CBItemRecommender
+from server.cache import LRUCache
+from server.exceptions import BaseApiException, AccessDeniedException
+from server.functions import get_abs_path, clean_json_dict_keys, is_admin_request, run_in_worker
+from server.metrics import REQUEST_SECONDS, REQUESTS, STAGE_SECONDS
+from server.profiling import SlowRequestWatchdog, run_profiled, format_profile_stats, get_worker_log_path
+from server.reloader import ModelReloader, load_model, load_recs_store
 
 logger = logging.getLogger(__name__)
 
@@ -22,13 +26,15 @@ class ApiAppJsonEncoder(json.JSONEncoder):
     def default(self, obj):
         if isinstance(obj, set):
             return list(obj)
-        if isinstance(obj, np.int32):
-            return int(obj)
-        if isinstance(obj, np.float64):
-            return float(obj)
+        if isinstance(obj, np.generic):
+            return obj.item()
         return json.JSONEncoder.default(self, obj)
 
 
+# encoders are stateless, so one encoder serves all threads
+json_encoder = ApiAppJsonEncoder()
+
+
 class APIApp(Flask):
     def __init__(self, *args, **kwargs):
         super(APIApp, self).__init__(*args, **kwargs)
@@ -48,48 +54,120 @@ class APIApp(Flask):
     def init(self, config_path):
         self._load_config(config_path)
         self._setup_logger()
-        self._load_data_providers()
-        self._load_recommenders()
+        self._load_model()
+        self._setup_recs_cache()
         logger.info(u"API has been initialized")
 
-    def _load_data_providers(self):
-        self.user_dp = UserDataProvider.load(self.config)
-        logger.info(u"User data provider has been initialized")
-
-        self.booking_dp = BookingDataProvider.load(self.config)
-        logger.info(u"Booking data provider has been initialized")
+    def _load_model(self):
+        self.model = load_model(self.config)
+        self.recs_store = load_recs_store(self.config)
+        if self.recs_store is not None:
+            logger.info(u"Recs store of model %s has been loaded", self.recs_store.version)
+        self.model_reloader = ModelReloader(self)
 
-        self.item_dp = ItemDataProvider.load(self.config)
-        logger.info(u"Item data provider has been initialized")
+        pointer_path = self.config.get('MODEL_POINTER_PATH')
+        if pointer_path and self.config.get('MODEL_POINTER_CHECK_INTERVAL'):
+            run_in_worker(lambda: self.model_reloader.start_watching(
+                pointer_path, self.config['MODEL_POINTER_CHECK_INTERVAL']
+            ))
 
-        self.item_feature_dp = ItemFeatureDataProvider.load(self.config)
-        logger.info(u"Item feature data provider has been initialized")
+    def _setup_recs_cache(self):
+        max_entries = self.config.get('RECS_CACHE_MAX_ENTRIES')
+        max_bytes = self.config.get('RECS_CACHE_MAX_BYTES')
 
-    def _load_recommenders(self):
-        self.item_pop_recommender = PopItemRecommender.load(
-            self.booking_dp, self.item_dp
-        )
-        logger.info(u"Item popularity based recommender has been initialized")
-
-        self.item_cb_recommender = CBItemRecommender.load(
-            self.booking_dp, self.item_dp, self.item_feature_dp
-        )
-        logger.info(u"Item content-based recommender has been initialized")
-
-        self.bg_recommender = ClusterRecommender.load(
-            self.config, self.user_dp, self.booking_dp, self.item_dp
-        )
-        logger.info(u"Personalized booking clusters recommender has been initialized")
+        self.recs_cache = None
+        if max_entries or max_bytes:
+            self.recs_cache = LRUCache(max_entries, max_bytes, self.config.get('RECS_CACHE_TTL'))
+            logger.info(u"Recs cache has been initialized: %s entries, %s bytes", max_entries, max_bytes)
 
     def setup_error_handlers(self):
         self.register_error_handler(BaseApiException, handle_exception_with_as_dict_method)
 
+    def setup_request_metrics(self):
+        self.before_request(self._start_request_timer)
+        self.after_request(self._observe_request)
+
+    @staticmethod
+    def _start_request_timer():
+        g.request_start = time.perf_counter()
+
+    @staticmethod
+    def _observe_request(response):
+        # requests to unknown urls are not tracked
+        if request.endpoint is not None and "request_start" in g:
+            REQUEST_SECONDS.labels(request.endpoint).observe(time.perf_counter() - g.request_start)
+            REQUESTS.labels(request.endpoint, response.status_code).inc()
+        return response
+
+    def setup_profiling(self):
+        """Nothing is added to the request path unless profiling is enabled in the config
+        """
+        if self.config.get('PROFILE_REQUESTS'):
+            self.dispatch_request = self._dispatch_profiled_request
+            logger.info(u"Profiling of admin requests has been enabled")
+
+        threshold = self.config.get('SLOW_REQUEST_THRESHOLD')
+        if threshold:
+            watchdog = SlowRequestWatchdog(
+                threshold, self.config['SLOW_REQUEST_LOG_PATH'],
+                interval=self.config.get('SLOW_REQUEST_SAMPLE_INTERVAL', 0.1),
+                max_samples=self.config.get('SLOW_REQUEST_MAX_SAMPLES', 10),
+                max_bytes=self.config.get('SLOW_REQUEST_LOG_MAX_BYTES', 10 * 1024 * 1024),
+                backup_count=self.config.get('SLOW_REQUEST_LOG_BACKUP_COUNT', 5),
+            )
+            self.before_request(lambda: watchdog.request_started(request.full_path))
+            self.teardown_request(lambda exc: watchdog.request_finished())
+            # the sampling thread has to run in the worker processes serving requests
+            run_in_worker(watchdog.start)
+            logger.info(u"Requests running longer than %ss are sampled to %s",
+                        threshold, get_worker_log_path(self.config['SLOW_REQUEST_LOG_PATH'], "<pid>"))
+
+    def _dispatch_profiled_request(self):
+        """Runs the handler and the response encoding under cProfile if the profile arg is set.
+        The stats are returned instead of the response or, if PROFILE_DIR is set, are dumped
+        to a file, the path is returned in the X-Profile-Path header.
+        """
+        dispatch_request = super(APIApp, self).dispatch_request
+        if not request.args.get("profile", type=int):
+            return dispatch_request()
+        if not is_admin_request(self.config, request.headers):
+            raise AccessDeniedException()
+
+        response, profiler = run_profiled(lambda: self.make_response(dispatch_request()))
+
+        profile_dir = self.config.get('PROFILE_DIR')
+        if profile_dir:
+            path = os.path.join(profile_dir, "%s-%s.prof" % (request.endpoint, int(time.time() * 1000)))
+            profiler.dump_stats(path)
+            response.headers['X-Profile-Path'] = path
+            return response
+
+        stats = format_profile_stats(profiler)
+        return self.response_class(stats, mimetype="text/plain")
+
+    @staticmethod
+    def dump_json(rv):
+        """Providers build responses of native types, so they are encoded
+        as is. Only dicts with numpy keys are copied with clean keys.
+        """
+        try:
+            return json_encoder.encode(rv)
+        except TypeError:
+            return json_encoder.encode(clean_json_dict_keys(rv))
+
+    def encode_response(self, rv):
+        """The same as dump_json, the encoding time is recorded as a stage of the request
+        """
+        start = time.perf_counter()
+        rv = self.dump_json(rv)
+        STAGE_SECONDS.labels(request.endpoint, "json_encoding").observe(time.perf_counter() - start)
+        return rv
+
     def make_response(self, rv):
         if isinstance(rv, self.response_class):
             return rv
         if isinstance(rv, (dict, list)):
-            rv = clean_json_dict_keys(rv)
-            rv = json.dumps(rv, cls=ApiAppJsonEncoder)
+            rv = self.encode_response(rv)
         elif isinstance(rv, bool):
             rv = "true" if rv else "false"
         return super(APIApp, self).make_response(rv)
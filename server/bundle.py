@@ -0,0 +1,276 @@
+"""
+Binary model bundle. The arrays of all data providers and recommenders
+are stored in one uncompressed npz file, so the server starts without
+parsing any text source. The arrays of the bundle can be memory-mapped,
+in this case they are shared by all processes serving the same bundle.
+The data of every array is aligned in the file, so the mapped arrays are
+aligned in memory too.
+"""
+
+import io
+import mmap
+import struct
+import sys
+import zipfile
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+FORMAT_VERSION = 8
+
+# data of every array starts at a multiple of it, so memory-mapped arrays are aligned
+ARRAY_ALIGNMENT = 64
+# id of the zip extra field padding local file headers, the one used by zipalign
+PADDING_EXTRA_ID = 0xD935
+LOCAL_HEADER_SIZE = 30
+ZIP64_EXTRA_SIZE = 20
+
+
+def _get_padding_extra(size):
+    if not size:
+        return b""
+    # an extra field takes at least 4 bytes of its own header
+    if size < 4:
+        size += ARRAY_ALIGNMENT
+    return struct.pack("<HH", PADDING_EXTRA_ID, size - 4) + b"\0" * (size - 4)
+
+
+def _has_zip64_extra(size):
+    """ Whether ZipFile.writestr adds the zip64 extra field to the local header of a member of the size
+    """
+    if sys.version_info < (3, 6):
+        return size > zipfile.ZIP64_LIMIT
+    return size * 1.05 > zipfile.ZIP64_LIMIT
+
+
+def _save_aligned_npz(f, arrays):
+    """ Writes arrays to an uncompressed npz file readable by np.load. The local
+    file headers are padded, so data of every array starts at a multiple of
+    ARRAY_ALIGNMENT bytes from the beginning of the file.
+    """
+    with zipfile.ZipFile(f, "w", zipfile.ZIP_STORED, allowZip64=True) as zf:
+        for name, arr in arrays.items():
+            arr = np.asarray(arr, order="C")
+            header = io.BytesIO()
+            np.lib.format.write_array_header_1_0(header, np.lib.format.header_data_from_array_1_0(arr))
+            data = header.getvalue() + arr.reshape(-1).view(np.uint8).data
+
+            info = zipfile.ZipInfo(name + ".npy")
+            info.compress_type = zipfile.ZIP_STORED
+            # the padding is the only unknown part of the local header and the npy header
+            unpadded_offset = f.tell() + LOCAL_HEADER_SIZE + len(info.filename.encode("utf-8")) + \
+                (ZIP64_EXTRA_SIZE if _has_zip64_extra(len(data)) else 0) + len(data) - arr.nbytes
+            info.extra = _get_padding_extra(-unpadded_offset % ARRAY_ALIGNMENT)
+            data_offset = unpadded_offset + len(info.extra)
+
+            zf.writestr(info, data)
+            assert f.tell() - arr.nbytes == data_offset, "Array %s isn't aligned" % name
+
+
+def save_bundle(path, version, groups):
+    """ Saves groups of arrays to a bundle file
+
+    :param path: a path to the bundle file
+    :param version: version of the model
+    :param groups: dict {group_name: {array_name: array, ...}, ...}
+    """
+    arrays = {
+        "format_version": np.array(FORMAT_VERSION),
+        "version": np.array(version),
+    }
+    for group, group_arrays in groups.items():
+        for name, arr in group_arrays.items():
+            arrays["%s.%s" % (group, name)] = arr
+
+    with open(path, "wb") as f:
+        _save_aligned_npz(f, arrays)
+
+
+def _mmap_npz(path):
+    """ Maps arrays of an npz file written by _save_aligned_npz into memory without
+    reading them. The resulting arrays are read-only.
+    """
+    arrays = {}
+    with open(path, "rb") as f, zipfile.ZipFile(f) as zf:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        for info in zf.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError("Compressed bundles can't be memory-mapped: %s" % path)
+
+            # the local file header has its own extra field
+            f.seek(info.header_offset + 26)
+            name_len, extra_len = struct.unpack("<HH", f.read(4))
+            f.seek(info.header_offset + 30 + name_len + extra_len)
+
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+
+            size = int(np.prod(shape))
+            if size:
+                arr = np.frombuffer(buf, dtype=dtype, count=size, offset=f.tell())
+                arr = arr.reshape(shape, order="F" if fortran_order else "C")
+            else:
+                arr = np.empty(shape, dtype=dtype)
+            # numpy copies unaligned arrays in most operations, e.g. searchsorted
+            assert arr.flags["ALIGNED"], "Array %s of %s isn't aligned" % (info.filename, path)
+            arrays[info.filename[:-len(".npy")]] = arr
+    return arrays
+
+
+class ModelBundle(object):
+    def __init__(self, arrays):
+        self._arrays = arrays
+        self.version = str(arrays["version"])
+
+    def get_group(self, group):
+        prefix = group + "."
+        return {
+            name[len(prefix):]: arr for name, arr in self._arrays.items()
+            if name.startswith(prefix)
+        }
+
+    @staticmethod
+    def load(path, mmap_arrays=False):
+        if mmap_arrays:
+            arrays = _mmap_npz(path)
+        else:
+            with np.load(path, allow_pickle=False) as npz:
+                arrays = {name: npz[name] for name in npz.files}
+
+        if int(arrays["format_version"]) != FORMAT_VERSION:
+            raise ValueError(
+                "Bundle format version %s is not supported, expected %s" %
+                (arrays["format_version"], FORMAT_VERSION)
+            )
+        return ModelBundle(arrays)
+
+
+class ArrayIdIndex(object):
+    """ Read-only id -> int index built on top of numpy arrays. Unlike
+    a dict it can be memory-mapped from a bundle.
+    """
+    def __init__(self, ids, values=None):
+        """
+        :param ids: sorted array of ids
+        :param values: array of values related to ids, by default positions of ids
+        """
+        self._ids = ids
+        self._values = values
+        # max length of string ids, numpy casts the whole array to fit a longer key
+        self._max_id_len = ids.dtype.itemsize // np.dtype("U1").itemsize if ids.dtype.kind == "U" else None
+
+    def _find(self, obj_id):
+        # keys that can't be among the ids are rejected before any cast of the ids
+        if self._max_id_len is not None:
+            if not isinstance(obj_id, str) or len(obj_id) > self._max_id_len:
+                return None
+        elif isinstance(obj_id, str):
+            return None
+
+        pos = int(np.searchsorted(self._ids, obj_id))
+        if pos < self._ids.size and self._ids[pos] == obj_id:
+            return pos
+        return None
+
+    def get(self, obj_id, default=None):
+        pos = self._find(obj_id)
+        if pos is None:
+            return default
+        return int(self._values[pos]) if self._values is not None else pos
+
+    def __getitem__(self, obj_id):
+        value = self.get(obj_id)
+        if value is None:
+            raise KeyError(obj_id)
+        return value
+
+    def __contains__(self, obj_id):
+        return self._find(obj_id) is not None
+
+    def __len__(self):
+        return self._ids.size
+
+    def __iter__(self):
+        return iter(self._ids.tolist())
+
+    def items(self):
+        values = self._values.tolist() if self._values is not None else range(self._ids.size)
+        return zip(self._ids.tolist(), values)
+
+
+def index_to_arrays(index, prefix):
+    """ Converts id -> int index (dict or ArrayIdIndex) to sorted arrays of ids and values
+    """
+    ids, values = zip(*index.items()) if len(index) else ((), ())
+    ids = np.array([str(obj_id) for obj_id in ids], dtype=np.str_)
+    values = np.array(values, dtype=np.int32)
+
+    order = np.argsort(ids, kind="mergesort")
+    return {
+        prefix + "_ids": ids[order],
+        prefix + "_values": values[order],
+    }
+
+
+def arrays_to_index(arrays, prefix):
+    return ArrayIdIndex(arrays[prefix + "_ids"], arrays[prefix + "_values"])
+
+
+def csr_to_arrays(m, prefix):
+    return {
+        prefix + "_data": m.data,
+        prefix + "_indices": m.indices,
+        prefix + "_indptr": m.indptr,
+        prefix + "_shape": np.array(m.shape),
+    }
+
+
+def arrays_to_csr(arrays, prefix):
+    return csr_matrix(
+        (arrays[prefix + "_data"], arrays[prefix + "_indices"], arrays[prefix + "_indptr"]),
+        shape=tuple(arrays[prefix + "_shape"])
+    )
+
+
+def group_features_to_arrays(group_features, prefix):
+    """ Converts {group_id: {feature: score, ...}, ...} to CSR-like arrays
+    """
+    group_ids = sorted(group_features)
+    feature_names = sorted({f for features in group_features.values() for f in features})
+    feature_to_id = {f: f_id for f_id, f in enumerate(feature_names)}
+
+    indptr = [0]
+    feature_ids = []
+    scores = []
+    for group_id in group_ids:
+        for feature, score in group_features[group_id].items():
+            feature_ids.append(feature_to_id[feature])
+            scores.append(score)
+        indptr.append(len(feature_ids))
+
+    return {
+        prefix + "_group_ids": np.array(group_ids, dtype=np.int32),
+        prefix + "_indptr": np.array(indptr, dtype=np.int64),
+        prefix + "_feature_ids": np.array(feature_ids, dtype=np.int32),
+        prefix + "_scores": np.array(scores, dtype=np.float64),
+        prefix + "_feature_names": np.array(feature_names, dtype=np.str_),
+    }
+
+
+def arrays_to_group_features(arrays, prefix):
+    indptr = arrays[prefix + "_indptr"]
+    feature_ids = arrays[prefix + "_feature_ids"]
+    scores = arrays[prefix + "_scores"].tolist()
+    feature_names = arrays[prefix + "_feature_names"].tolist()
+
+    group_features = {}
+    for i, group_id in enumerate(arrays[prefix + "_group_ids"].tolist()):
+        group_features[group_id] = {
+            feature_names[feature_ids[pos]]: scores[pos] for pos in range(indptr[i], indptr[i + 1])
+        }
+    return group_features
+
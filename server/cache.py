@@ -0,0 +1,91 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """Thread-safe in-process cache with LRU eviction and optional TTL.
+    It is bounded by the number of entries, by the total size of values or by both.
+    """
+    def __init__(self, max_entries=None, max_bytes=None, ttl=None, get_size=len):
+        """
+        :param max_entries: max number of entries
+        :param max_bytes: max total size of values, the size is computed by get_size
+        :param ttl: time to live of entries in seconds
+        :param get_size: function returning the size of a value in bytes,
+            len by default, so values are expected to be bytes
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._get_size = get_size
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, size, expire_at)
+        self._n_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _pop(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._n_bytes -= size
+
+    def _is_full(self):
+        return (
+            (self.max_entries is not None and len(self._entries) > self.max_entries) or
+            (self.max_bytes is not None and self._n_bytes > self.max_bytes)
+        )
+
+    def get(self, key):
+        """Returns the cached value or None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] is not None and entry[2] <= time.monotonic():
+                self._pop(key)
+                self.expirations += 1
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        size = self._get_size(value) if self.max_bytes is not None else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+
+        expire_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+
+            self._entries[key] = (value, size, expire_at)
+            self._n_bytes += size
+
+            while self._is_full():
+                self._pop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._n_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._n_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
@@ -2,21 +2,28 @@ import numpy as np
 import pandas as pd
 from scipy.sparse import csr_matrix
 
-from misc.common import get_ug_data, get_bg_data, get_group_features
+from server.bundle import csr_to_arrays, arrays_to_csr, group_features_to_arrays, arrays_to_group_features, \
+    index_to_arrays, arrays_to_index
+from server.functions import get_top_not_excluded, get_segment_positions, get_first_per_segment
 
 
 FEATURE_THRESHOLD = 0.5
 
 
 class ObjFeatureSparseData(object):
-    def __init__(self, m, obj_to_row, feature_to_col):
+    def __init__(self, m, obj_to_row, feature_to_col, row_to_obj=None, col_to_feature=None):
         self.m = m
 
         self.obj_to_row = obj_to_row
         self.feature_to_col = feature_to_col
 
-        self.row_to_obj = {row_id: obj_id for obj_id, row_id in obj_to_row.items()}
-        self.col_to_feature = {col_id: fid for fid, col_id in feature_to_col.items()}
+        if row_to_obj is None:
+            row_to_obj = {row_id: obj_id for obj_id, row_id in obj_to_row.items()}
+        if col_to_feature is None:
+            col_to_feature = {col_id: fid for fid, col_id in feature_to_col.items()}
+
+        self.row_to_obj = row_to_obj
+        self.col_to_feature = col_to_feature
 
     @property
     def n_objs(self):
@@ -40,107 +47,296 @@ class ObjFeatureSparseData(object):
         row_ids = [self.obj_to_row[obj_id] for obj_id in objs_ids]
         return self.m[row_ids]
 
+    def dump(self, prefix):
+        arrays = csr_to_arrays(self.m, prefix + "_m")
+        arrays.update(index_to_arrays(self.obj_to_row, prefix + "_obj_to_row"))
+        arrays.update(index_to_arrays(self.feature_to_col, prefix + "_feature_to_col"))
+        arrays[prefix + "_objs"] = np.array([str(self.row_to_obj[row_id]) for row_id in range(self.n_objs)])
+        arrays[prefix + "_features"] = np.array(
+            [self.col_to_feature[col_id] for col_id in range(self.n_features)], dtype=np.str_
+        )
+        return arrays
+
+    @staticmethod
+    def load_bundle(arrays, prefix):
+        return ObjFeatureSparseData(
+            arrays_to_csr(arrays, prefix + "_m"),
+            arrays_to_index(arrays, prefix + "_obj_to_row"),
+            arrays_to_index(arrays, prefix + "_feature_to_col"),
+            arrays[prefix + "_objs"],
+            arrays[prefix + "_features"]
+        )
+
+
+class ThresholdedFeatures(object):
+    """ Features of objects with scores above FEATURE_THRESHOLD stored as CSR-like
+    arrays: the features of an object are one slice of feature ids and scores
+    """
+    def __init__(self, obj_to_row, indptr, feature_ids, scores, feature_names):
+        self._obj_to_row = obj_to_row
+        self._indptr = indptr
+        self._feature_ids = feature_ids
+        self._scores = scores
+        self._feature_names = feature_names
+
+    def get(self, obj_id):
+        row_id = self._obj_to_row.get(obj_id)
+        if row_id is None:
+            return {}
+
+        start, end = self._indptr[row_id], self._indptr[row_id + 1]
+        feature_names = self._feature_names
+        return {
+            feature_names[feature_id]: score
+            for feature_id, score in zip(self._feature_ids[start:end].tolist(), self._scores[start:end].tolist())
+        }
+
+    def dump(self, prefix):
+        arrays = index_to_arrays(self._obj_to_row, prefix + "_obj_to_row")
+        arrays[prefix + "_indptr"] = self._indptr
+        arrays[prefix + "_feature_ids"] = self._feature_ids
+        arrays[prefix + "_scores"] = self._scores
+        arrays[prefix + "_feature_names"] = np.array(self._feature_names, dtype=np.str_)
+        return arrays
+
+    @staticmethod
+    def from_frame(df):
+        """
+        :param df: pandas.DataFrame with a row of feature scores per object, the index is object ids
+        """
+        rows, cols = np.nonzero(df.values > FEATURE_THRESHOLD)
+        return ThresholdedFeatures(
+            {str(obj_id): row_id for row_id, obj_id in enumerate(df.index)},
+            np.r_[0, np.cumsum(np.bincount(rows, minlength=df.shape[0]))],
+            cols.astype(np.int32),
+            df.values[rows, cols].astype(np.float64),
+            [str(feature) for feature in df.columns]
+        )
+
+    @staticmethod
+    def load_bundle(arrays, prefix):
+        return ThresholdedFeatures(
+            arrays_to_index(arrays, prefix + "_obj_to_row"),
+            arrays[prefix + "_indptr"],
+            arrays[prefix + "_feature_ids"],
+            arrays[prefix + "_scores"],
+            arrays[prefix + "_feature_names"].tolist()
+        )
+
 
 class UserDataProvider(object):
-    def __init__(self, udf, uid_to_ug, ug_features):
-        # TODO probably later *df-s should be removed from constructors
+    def __init__(self, uid_to_ug, ug_features, uid_features):
+        """
+        :param uid_features: ThresholdedFeatures of users
+        """
         self._uid_to_ug = uid_to_ug
         self._ug_features = ug_features
-        self._prepare_uid_features(udf)
+        self._uid_features = uid_features
 
-    def _prepare_uid_features(self, udf):
+    @staticmethod
+    def _prepare_uid_features(udf):
         udf = udf.set_index("code")
         booking_cnt = udf.booking_cnt
-        udf = udf.drop(["booking_cnt"], axis=1).apply(lambda x: x / booking_cnt)
-        self._uid_features = udf
+        return ThresholdedFeatures.from_frame(udf.drop(["booking_cnt"], axis=1).apply(lambda x: x / booking_cnt))
 
     def get_cluster_id(self, uid):
         return self._uid_to_ug.get(uid)
 
+    def get_uids(self):
+        return list(self._uid_to_ug)
+
     def get_uid_features(self, uid):
-        uid_features = {}
-        if uid in self._uid_features.index:
-            for feature, score in self._uid_features.loc[uid].items():
-                if score > FEATURE_THRESHOLD:
-                    uid_features[feature] = score
-        return uid_features
+        return self._uid_features.get(uid)
 
     def get_cluster_features(self, cluster_id):
         return self._ug_features.get(cluster_id, {})
 
+    def dump(self):
+        arrays = index_to_arrays(self._uid_to_ug, "uid_to_ug")
+        arrays.update(group_features_to_arrays(self._ug_features, "ug_features"))
+        arrays.update(self._uid_features.dump("uid_features"))
+        return arrays
+
     @staticmethod
-    def load(config):
-        uid_to_ug = get_ug_data(config['UG_FILE_PATH'])
-        ug_features = get_group_features(config['UG_FILE_PATH'])
-        udf = pd.read_csv(config['USER_FEATURE_FILE_PATH'])
-        return UserDataProvider(udf, uid_to_ug, ug_features)
+    def load(context):
+        """
+        :param context: server.model.LoadContext with parsed raw sources
+        """
+        uid_to_ug, ug_features = context.get("user_clusters")
+        udf = context.get("user_features")
+        return UserDataProvider(uid_to_ug, ug_features, UserDataProvider._prepare_uid_features(udf))
+
+    @staticmethod
+    def load_bundle(bundle):
+        arrays = bundle.get_group("user_dp")
+        uid_to_ug = arrays_to_index(arrays, "uid_to_ug")
+        ug_features = arrays_to_group_features(arrays, "ug_features")
+        uid_features = ThresholdedFeatures.load_bundle(arrays, "uid_features")
+        return UserDataProvider(uid_to_ug, ug_features, uid_features)
 
 
 class BookingDataProvider(object):
-    def __init__(self, bdf, bg_features):
+    def __init__(self, bg_features, obs_per_iid, uid_iid_cols, uid_booking_summaries):
+        """
+        :param bg_features: dict {bg_id: {feature: score, ...}, ...}
+        :param obs_per_iid: arrays (iids, counts) with the number of bookings per iid
+        :param uid_iid_cols: CSR-like index uid -> booked item columns as a tuple
+            (uid_to_row, indptr, cols), the columns are the same as ItemDataProvider.iid_to_col
+        :param uid_booking_summaries: ThresholdedFeatures with average booking features per uid
+        """
         self._bg_features = bg_features
+        self._obs_iids, self._obs_counts = obs_per_iid
 
-        self._prepare_obs_per_iid(bdf)
-        self._prepare_booking_iid_uid_part(bdf)
-        self._prepare_uid_booking_summaries(bdf)
+        self._uid_to_row, self._uid_iid_indptr, self._uid_iid_cols = uid_iid_cols
 
-    def _prepare_obs_per_iid(self, bdf):
-        self._obs_per_iid = bdf.groupby('propcode').bookcode.nunique()
+        self._uid_booking_summaries = uid_booking_summaries
 
-    def _prepare_booking_iid_uid_part(self, bdf):
-        cols = ["bookcode", "propcode", "code"]
-        self._b_iid_uid = bdf[cols]
+    @staticmethod
+    def _prepare_obs_per_iid(bdf):
+        obs_per_iid = bdf.groupby('propcode').bookcode.nunique()
+        return obs_per_iid.index.values, obs_per_iid.values
 
-    def _prepare_uid_booking_summaries(self, bdf):
+    @staticmethod
+    def _prepare_uid_iid_cols(bdf, iid_to_col):
+        df = bdf[["code", "propcode"]].drop_duplicates()
+        cols = df.propcode.map(iid_to_col)
+        df, cols = df[cols.notnull()], cols[cols.notnull()].values.astype(np.int32)
+
+        uids, rows = np.unique(df.code.values, return_inverse=True)
+        order = np.argsort(rows, kind="mergesort")
+        indptr = np.r_[0, np.cumsum(np.bincount(rows, minlength=uids.size))]
+        return {uid: row_id for row_id, uid in enumerate(uids)}, indptr, cols[order]
+
+    @staticmethod
+    def _prepare_uid_booking_summaries(bdf):
         cols = ["bookcode", "propcode", "year"]
         data = bdf.drop(cols, axis=1)
-        data = data.groupby("code").mean()
-        self._uid_booking_summaries = data
+        return ThresholdedFeatures.from_frame(data.groupby("code").mean())
+
+    def get_iid_cols_for_uid(self, uid):
+        row_id = self._uid_to_row.get(uid)
+        if row_id is None:
+            return self._uid_iid_cols[:0]
+        return self._uid_iid_cols[self._uid_iid_indptr[row_id]:self._uid_iid_indptr[row_id + 1]]
+
+    def get_iid_cols_matrix(self, uids, n_iids):
+        """ Binary users x items matrix of booked items, a row per uid
+        """
+        indptr = [0]
+        cols = []
+        for uid in uids:
+            cols.append(self.get_iid_cols_for_uid(uid))
+            indptr.append(indptr[-1] + cols[-1].size)
 
-    def get_iids_for_uid(self, uid):
-        return set(self._b_iid_uid[self._b_iid_uid.code == uid].propcode)
+        cols = np.concatenate(cols) if cols else np.array([], dtype=np.int32)
+        return csr_matrix((np.ones(cols.size), cols, indptr), shape=(len(uids), n_iids))
 
     def get_obs_per_iid(self):
-        return self._obs_per_iid
+        """ pandas.Series with the number of bookings per iid, it is built on every call,
+            because it is needed only to rank items of raw sources
+        """
+        return pd.Series(self._obs_counts, index=self._obs_iids.tolist(), name="bookcode")
 
     def get_cluster_features(self, cluster_id):
         return self._bg_features.get(cluster_id, {})
 
     def get_uid_booking_summary(self, uid):
-        summary = {}
-        if uid in self._uid_booking_summaries.index:
-            for feature, score in self._uid_booking_summaries.loc[uid].items():
-                if score > FEATURE_THRESHOLD:
-                    summary[feature] = score
-        return summary
+        return self._uid_booking_summaries.get(uid)
+
+    def dump(self):
+        arrays = {
+            "obs_per_iid_index": np.array(self._obs_iids.tolist()),
+            "obs_per_iid_values": self._obs_counts,
+            "uid_iid_indptr": self._uid_iid_indptr,
+            "uid_iid_cols": self._uid_iid_cols,
+        }
+        arrays.update(index_to_arrays(self._uid_to_row, "uid_to_row"))
+        arrays.update(group_features_to_arrays(self._bg_features, "bg_features"))
+        arrays.update(self._uid_booking_summaries.dump("uid_booking_summaries"))
+        return arrays
+
+    @staticmethod
+    def load(context, item_dp):
+        bdf = context.get("bookings")
+        _, bg_features = context.get("booking_clusters")
+        return BookingDataProvider(
+            bg_features,
+            BookingDataProvider._prepare_obs_per_iid(bdf),
+            BookingDataProvider._prepare_uid_iid_cols(bdf, item_dp.iid_to_col),
+            BookingDataProvider._prepare_uid_booking_summaries(bdf)
+        )
 
     @staticmethod
-    def load(config):
-        bdf = pd.read_csv(config['BOOKING_FEATURE_FILE_PATH'])
-        bg_features = get_group_features(config['BG_FILE_PATH'])
-        return BookingDataProvider(bdf, bg_features)
+    def load_bundle(bundle):
+        arrays = bundle.get_group("booking_dp")
+        obs_per_iid = arrays["obs_per_iid_index"], arrays["obs_per_iid_values"]
+        uid_iid_cols = arrays_to_index(arrays, "uid_to_row"), arrays["uid_iid_indptr"], arrays["uid_iid_cols"]
+        return BookingDataProvider(
+            arrays_to_group_features(arrays, "bg_features"),
+            obs_per_iid,
+            uid_iid_cols,
+            ThresholdedFeatures.load_bundle(arrays, "uid_booking_summaries")
+        )
 
 
 class ItemDataProvider(object):
-    def __init__(self, pdf, bg_iids):
-        self._prepare_active_iids(pdf)
-        self._prepare_bg_iid_data(bg_iids)
+    def __init__(self, active_iids, iid_to_col, col_to_iid, bg_iid_m, bg_iid_ranking=None,
+                 active_col_mask=None, iid_bg_index=None):
+        """
+        :param active_iids: collection of active iids
+        :param bg_iid_ranking: CSR-like arrays (indptr, cols, scores) of items of every booking
+            cluster sorted by score, if None they have to be built by prepare_bg_iid_ranking
+        :param active_col_mask: mask of active item columns, it is built from active_iids if None
+        :param iid_bg_index: arrays (iid_per_bg, indptr, bg_ids) with the number of active items
+            per booking cluster and CSR-like item column -> booking clusters index,
+            they are built from bg_iid_m if None
+        """
+        self._active_iids = active_iids
+        self.iid_to_col = iid_to_col
+        self.col_to_iid = col_to_iid
+        self.bg_iid_m = bg_iid_m
+
+        if active_col_mask is None:
+            active_col_mask = self._prepare_active_col_mask(active_iids, col_to_iid, self.n_iids)
+        self.active_col_mask = active_col_mask
+
+        if iid_bg_index is None:
+            iid_bg_index = self._prepare_iid_bg_index(bg_iid_m, active_col_mask)
+        self._iid_per_bg, self._iid_bg_indptr, self._iid_bg_ids = iid_bg_index
+
+        if bg_iid_ranking is not None:
+            self._bg_rank_indptr, self._bg_rank_cols, self._bg_rank_scores = bg_iid_ranking
+
+    @staticmethod
+    def _prepare_active_iids(pdf):
+        return set(pdf[pdf.active == -1].propcode)
+
+    @staticmethod
+    def _prepare_active_col_mask(active_iids, col_to_iid, n_iids):
+        return np.array([col_to_iid[col] in active_iids for col in range(n_iids)], dtype=bool)
 
-    def _prepare_active_iids(self, pdf):
-        self._active_iids = set(pdf[pdf.active == -1].propcode)
+    @staticmethod
+    def _prepare_iid_bg_index(bg_iid_m, active_col_mask):
+        # number of active items per booking cluster and item -> booking clusters index
+        iid_bg_m = bg_iid_m.tocsc()
+        return bg_iid_m.dot(active_col_mask.astype(float)), iid_bg_m.indptr, iid_bg_m.indices.astype(np.int32)
 
-    def _prepare_bg_iid_data(self, bg_iids):
-        self.iid_to_col = {}
+    @staticmethod
+    def _prepare_bg_iid_data(bg_iids):
+        iid_to_col = {}
 
         rows = []
         cols = []
         for bg_id, iids in bg_iids.items():
             rows += [bg_id] * len(iids)
             for iid in iids:
-                cols.append(self.iid_to_col.setdefault(iid, len(self.iid_to_col)))
+                cols.append(iid_to_col.setdefault(iid, len(iid_to_col)))
 
-        self.col_to_iid = {col: iid for iid, col in self.iid_to_col.items()}
-        self.bg_iid_m = csr_matrix((np.ones(len(rows)), (rows, cols)))
+        return iid_to_col, csr_matrix((np.ones(len(rows)), (rows, cols)))
+
+    @property
+    def n_iids(self):
+        return len(self.iid_to_col)
 
     def get_score_per_iid_row(self, iids, scores=None):
         if scores is not None:
@@ -157,62 +353,207 @@ class ItemDataProvider(object):
             data = np.ones(len(cols))
         return csr_matrix((data, (np.zeros(len(cols)), cols)), shape=(1, len(self.iid_to_col)))
 
-    def get_iid_per_bg_row(self, iid_mask, min_iid_per_bg):
-        iid_per_bg = self.bg_iid_m.multiply(iid_mask).sum(axis=1).A1
-        iid_per_bg[iid_per_bg < min_iid_per_bg] = 0
-        return csr_matrix(iid_per_bg, shape=(1, iid_per_bg.size))
+    def get_excluded_bg_ids(self, exclude_cols):
+        """ Sorted booking clusters of the active items from exclude_cols,
+            a cluster is repeated for every its excluded item
+        """
+        # only active items are counted, so only they have to be subtracted
+        cols = exclude_cols[self.active_col_mask[exclude_cols]]
+        if not cols.size:
+            return self._iid_bg_ids[:0]
+
+        bg_ids = np.concatenate([
+            self._iid_bg_ids[self._iid_bg_indptr[col]:self._iid_bg_indptr[col + 1]] for col in cols
+        ])
+        bg_ids.sort()
+        return bg_ids
+
+    def get_iid_per_bgs(self, bg_ids, excluded_bg_ids, min_iid_per_bg=None):
+        """ Number of active not excluded items of the booking clusters
+
+        :param excluded_bg_ids: result of get_excluded_bg_ids
+        """
+        n_excluded = np.searchsorted(excluded_bg_ids, bg_ids, "right") - np.searchsorted(excluded_bg_ids, bg_ids)
+        iid_per_bg = self._iid_per_bg[bg_ids] - n_excluded
+
+        if min_iid_per_bg is not None:
+            iid_per_bg[iid_per_bg < min_iid_per_bg] = 0
+        return iid_per_bg
+
+    def get_iid_per_bg_matrix(self, exclude_m, min_iid_per_bg=None):
+        """ The same as get_iid_per_bgs, but for all booking clusters and several users at once
+
+        :param exclude_m: binary users x items matrix of items to exclude
+        :return: users x booking clusters array
+        """
+        exclude_m = csr_matrix(exclude_m.multiply(self.active_col_mask))
+        iid_per_bg = self._iid_per_bg - exclude_m.dot(self.bg_iid_m.T).toarray()
+
+        if min_iid_per_bg is not None:
+            iid_per_bg[iid_per_bg < min_iid_per_bg] = 0
+        return iid_per_bg
 
     def get_active_iids(self):
         return self._active_iids
 
-    def prepare_iid_recs(self, iid_recs, top_items=None):
-        recs = []
-
-        if top_items is None:
-            arg_ids = np.argsort(iid_recs.data)[::-1]
-        else:
-            arg_ids = np.argsort(iid_recs.data)[-top_items:][::-1]
-
-        for arg_id in arg_ids:
-            recs.append({
-                "propcode": self.col_to_iid[iid_recs.indices[arg_id]],
-                "score": iid_recs.data[arg_id]
-            })
-        return recs
+    def _get_iid_recs(self, cols, scores):
+        return [
+            {"propcode": str(self.col_to_iid[col]), "score": score}
+            for col, score in zip(cols.tolist(), scores.tolist())
+        ]
 
-    def prepare_bg_recs(self, bg_recs, iid_recs, top_clusters=None, top_items=None):
-        recs = []
-
-        if top_clusters is None:
-            arg_ids = np.argsort(bg_recs.data)[::-1]
-        else:
-            arg_ids = np.argsort(bg_recs.data)[-top_clusters:][::-1]
-
-        _bg_iid_m = self.bg_iid_m.multiply(iid_recs)
-        for arg_id in arg_ids:
-            bg_id, bg_score = bg_recs.indices[arg_id], bg_recs.data[arg_id]
-            recs.append({
+    def prepare_iid_recs(self, iid_recs, top_items=None):
+        # items are sorted by score, ties are resolved by column id
+        arg_ids = np.lexsort((iid_recs.indices, -iid_recs.data))[:top_items]
+        return self._get_iid_recs(iid_recs.indices[arg_ids], iid_recs.data[arg_ids])
+
+    def prepare_iid_recs_batch(self, iid_recs_m):
+        """ The same as prepare_iid_recs, but for every row of users x items matrix
+
+        :return: list of recs per row
+        """
+        iid_recs_m = csr_matrix(iid_recs_m)
+        rows = np.repeat(np.arange(iid_recs_m.shape[0]), np.diff(iid_recs_m.indptr))
+        arg_ids = np.lexsort((iid_recs_m.indices, -iid_recs_m.data, rows))
+        recs = self._get_iid_recs(iid_recs_m.indices[arg_ids], iid_recs_m.data[arg_ids])
+
+        indptr = iid_recs_m.indptr.tolist()
+        return [recs[indptr[row_id]:indptr[row_id + 1]] for row_id in range(iid_recs_m.shape[0])]
+
+    def prepare_bg_iid_ranking(self, ranked_cols, ranked_scores):
+        """ Sorts items of every booking cluster in the order of the ranking of all items,
+            items out of the ranking are skipped
+
+        :param ranked_cols, ranked_scores: item columns ordered by score and their scores,
+            see PopItemRecommender.get_ranking
+        """
+        item_ranks = np.full(self.n_iids, -1)
+        item_ranks[ranked_cols] = np.arange(ranked_cols.size)
+
+        bg_iid_m = csr_matrix(self.bg_iid_m)
+        rows = np.repeat(np.arange(bg_iid_m.shape[0]), np.diff(bg_iid_m.indptr))
+        ranks = item_ranks[bg_iid_m.indices]
+        kept = (ranks >= 0) & (bg_iid_m.data != 0)
+        rows, ranks = rows[kept], ranks[kept]
+        ranks = ranks[np.lexsort((ranks, rows))]
+
+        self._bg_rank_indptr = np.r_[0, np.cumsum(np.bincount(rows, minlength=bg_iid_m.shape[0]))]
+        self._bg_rank_cols = ranked_cols[ranks].astype(np.int32)
+        self._bg_rank_scores = ranked_scores[ranks]
+
+    def prepare_bg_iid_recs(self, bg_id, exclude_cols, top_items=None):
+        start, end = self._bg_rank_indptr[bg_id], self._bg_rank_indptr[bg_id + 1]
+        cols, scores = get_top_not_excluded(
+            self._bg_rank_cols[start:end], self._bg_rank_scores[start:end], exclude_cols, top_items
+        )
+        return self._get_iid_recs(cols, scores)
+
+    def prepare_bg_recs(self, bg_ids, bg_scores, exclude_cols, top_items=None):
+        """
+        :param bg_ids: recommended booking clusters sorted by score
+        :param bg_scores: scores of the booking clusters
+        """
+        return [
+            {
+                "bg_id": bg_id,
+                "score": bg_score,
+                "properties": self.prepare_bg_iid_recs(bg_id, exclude_cols, top_items)
+            }
+            for bg_id, bg_score in zip(bg_ids.tolist(), bg_scores.tolist())
+        ]
+
+    def prepare_bg_recs_batch(self, bg_indptr, bg_ids, bg_scores, exclude_m, top_items=None):
+        """ The same as prepare_bg_recs, but for several users at once. Ranked items
+            of all recommended booking clusters are gathered and filtered together
+
+        :param bg_indptr, bg_ids, bg_scores: recommended booking clusters of every user,
+            see ClusterRecommender.get_recs_batch
+        :param exclude_m: binary users x items matrix of items to exclude
+        :return: list of recs per user
+        """
+        top_items = top_items or None
+        exclude_m = csr_matrix(exclude_m)
+        # user of every recommended booking cluster
+        bg_rows = np.repeat(np.arange(bg_indptr.size - 1), np.diff(bg_indptr))
+
+        starts = self._bg_rank_indptr[bg_ids]
+        lengths = self._bg_rank_indptr[bg_ids + 1] - starts
+        if top_items:
+            # the first top + number of excluded items always contain top not excluded ones
+            lengths = np.minimum(lengths, top_items + np.diff(exclude_m.indptr)[bg_rows])
+        positions, seg_ids = get_segment_positions(starts, lengths)
+        cols = self._bg_rank_cols[positions]
+
+        # user-item pairs are compared as int64 keys
+        n_iids = np.int64(self.n_iids)
+        excluded_rows = np.repeat(np.arange(exclude_m.shape[0]), np.diff(exclude_m.indptr))
+        excluded_keys = (excluded_rows * n_iids + exclude_m.indices)[exclude_m.data != 0]
+        mask = ~np.isin(bg_rows[seg_ids] * n_iids + cols, excluded_keys)
+
+        kept = get_first_per_segment(mask, seg_ids, top_items)
+        iid_recs = self._get_iid_recs(cols[kept], self._bg_rank_scores[positions[kept]])
+        iid_indptr = np.r_[0, np.cumsum(np.bincount(seg_ids[kept], minlength=bg_ids.size))].tolist()
+
+        bg_recs = [
+            {
                 "bg_id": bg_id,
                 "score": bg_score,
-                "properties": self.prepare_iid_recs(_bg_iid_m[bg_id], top_items)
-            })
-        return recs
+                "properties": iid_recs[iid_indptr[i]:iid_indptr[i + 1]]
+            }
+            for i, (bg_id, bg_score) in enumerate(zip(bg_ids.tolist(), bg_scores.tolist()))
+        ]
+        bg_indptr = bg_indptr.tolist()
+        return [bg_recs[bg_indptr[row_id]:bg_indptr[row_id + 1]] for row_id in range(len(bg_indptr) - 1)]
+
+    def dump(self):
+        arrays = {
+            "active_iids": np.array(sorted(self._active_iids)),
+            "col_to_iid": np.array([str(self.col_to_iid[col]) for col in range(self.n_iids)]),
+        }
+        arrays.update(index_to_arrays(self.iid_to_col, "iid_to_col"))
+        arrays.update(csr_to_arrays(self.bg_iid_m, "bg_iid_m"))
+        arrays.update({
+            "bg_rank_indptr": self._bg_rank_indptr,
+            "bg_rank_cols": self._bg_rank_cols,
+            "bg_rank_scores": self._bg_rank_scores,
+            "active_col_mask": self.active_col_mask,
+            "iid_per_bg": self._iid_per_bg,
+            "iid_bg_indptr": self._iid_bg_indptr,
+            "iid_bg_ids": self._iid_bg_ids,
+        })
+        return arrays
 
     @staticmethod
-    def load(config):
+    def load(context):
         cols = ["propcode", "active"]
-        pdf = pd.read_csv(config['PROPERTY_FILE_PATH'])[cols]
-        bid_to_bgs, bg_iids = get_bg_data(config['BG_FILE_PATH'])
-        return ItemDataProvider(pdf, bg_iids)
+        pdf = context.get("properties")[cols]
+        bg_iids, _ = context.get("booking_clusters")
+        iid_to_col, bg_iid_m = ItemDataProvider._prepare_bg_iid_data(bg_iids)
+        col_to_iid = {col: iid for iid, col in iid_to_col.items()}
+        return ItemDataProvider(ItemDataProvider._prepare_active_iids(pdf), iid_to_col, col_to_iid, bg_iid_m)
+
+    @staticmethod
+    def load_bundle(bundle):
+        arrays = bundle.get_group("item_dp")
+        return ItemDataProvider(
+            arrays["active_iids"],
+            arrays_to_index(arrays, "iid_to_col"),
+            arrays["col_to_iid"],
+            arrays_to_csr(arrays, "bg_iid_m"),
+            (arrays["bg_rank_indptr"], arrays["bg_rank_cols"], arrays["bg_rank_scores"]),
+            arrays["active_col_mask"],
+            (arrays["iid_per_bg"], arrays["iid_bg_indptr"], arrays["iid_bg_ids"])
+        )
 
 
 class ItemFeatureDataProvider(object):
-    def __init__(self, bdf, pfdf):
+    def __init__(self, ifd, ufd):
         # obj-feature data based on items
-        self._prepare_item_feature_data(pfdf)
-        self._prepare_user_feature_data(bdf, pfdf)
+        self._ifd = ifd
+        self._ufd = ufd
 
-    def _prepare_item_feature_data(self, pfdf):
+    @staticmethod
+    def _prepare_item_feature_data(pfdf):
         feature_to_col = {
             fid: col_id for col_id, fid in
             enumerate(pfdf.columns.drop(["year", "propcode"]))
@@ -220,22 +561,43 @@ class ItemFeatureDataProvider(object):
         data = pfdf.drop(["year"], axis=1).groupby("propcode").mean()
         iid_to_row = {iid: row_id for row_id, iid in enumerate(data.index)}
         m = csr_matrix(data.values, shape=(len(iid_to_row), len(feature_to_col)))
-        self._ifd = ObjFeatureSparseData(m, iid_to_row, feature_to_col)
+        return ObjFeatureSparseData(m, iid_to_row, feature_to_col)
 
-    def _prepare_user_feature_data(self, bdf, pfdf):
-        _df = pd.merge(bdf, pfdf, on=["propcode", "year"])
-        feature_to_col = {
-            fid: col_id for col_id, fid in
-            enumerate(_df.columns.drop(["propcode", "year", "code"]))
-        }
-        data = _df.drop(["propcode", "year"], axis=1).groupby("code").mean()
-        uid_to_row = {uid: row_id for row_id, uid in enumerate(data.index)}
-        m = csr_matrix(data.values, shape=(len(uid_to_row), len(feature_to_col)))
-        self._ufd = ObjFeatureSparseData(m, uid_to_row, feature_to_col)
+    @staticmethod
+    def _prepare_user_feature_data(bdf, pfdf):
+        """ User vectors are the average features of booked items, they are computed as
+            a product of users x (propcode, year) booking counts and (propcode, year) x features
+            matrices. Features are binary, so float32 sums are exact.
+        """
+        feature_cols = pfdf.columns.drop(["propcode", "year"])
+        feature_to_col = {fid: col_id for col_id, fid in enumerate(feature_cols)}
+
+        # only keys are merged, the bookings are matched to rows of pfdf
+        keys = pfdf[["propcode", "year"]].assign(pf_row=np.arange(pfdf.shape[0]))
+        _df = pd.merge(bdf[["code", "propcode", "year"]], keys, on=["propcode", "year"])
+        uids, rows = np.unique(_df.code.values, return_inverse=True)
+        booking_m = csr_matrix(
+            (np.ones(rows.size, dtype=np.float32), (rows, _df.pf_row.values)),
+            shape=(uids.size, pfdf.shape[0])
+        )
+        booking_cnt = np.asarray(booking_m.sum(axis=1), dtype=np.float64).ravel()
+
+        m = booking_m.dot(csr_matrix(pfdf[feature_cols].values.astype(np.float32))).astype(np.float64)
+        m.eliminate_zeros()
+        m.data /= np.repeat(booking_cnt, np.diff(m.indptr))
+
+        uid_to_row = {uid: row_id for row_id, uid in enumerate(uids.tolist())}
+        return ObjFeatureSparseData(m, uid_to_row, feature_to_col)
 
     def has_uid_features(self, uid):
         return uid in self._ufd.obj_to_row
 
+    def get_uids(self):
+        return list(self._ufd.obj_to_row)
+
+    def has_iid_features(self, iid):
+        return iid in self._ifd.obj_to_row
+
     def get_uids_feature_matrix(self, uids):
         row_ids = [self._ufd.obj_to_row[uid] for uid in uids]
         return self._ufd.m[row_ids]
@@ -244,9 +606,25 @@ class ItemFeatureDataProvider(object):
         row_ids = [self._ifd.obj_to_row[iid] for iid in iids]
         return self._ifd.m[row_ids]
 
+    def dump(self):
+        arrays = self._ifd.dump("ifd")
+        arrays.update(self._ufd.dump("ufd"))
+        return arrays
+
     @staticmethod
-    def load(config):
+    def load(context):
         cols = ["code", "propcode", "year"]
-        bdf = pd.read_csv(config['BOOKING_FEATURE_FILE_PATH'])[cols]
-        pfdf = pd.read_csv(config['PROPERTY_FEATURE_FILE_PATH'])
-        return ItemFeatureDataProvider(bdf, pfdf)
+        bdf = context.get("bookings")[cols]
+        pfdf = context.get("property_features")
+        return ItemFeatureDataProvider(
+            ItemFeatureDataProvider._prepare_item_feature_data(pfdf),
+            ItemFeatureDataProvider._prepare_user_feature_data(bdf, pfdf)
+        )
+
+    @staticmethod
+    def load_bundle(bundle):
+        arrays = bundle.get_group("item_feature_dp")
+        return ItemFeatureDataProvider(
+            ObjFeatureSparseData.load_bundle(arrays, "ifd"),
+            ObjFeatureSparseData.load_bundle(arrays, "ufd")
+        )
@@ -54,3 +54,51 @@ PROPERTY_FILE_PATH = None
 PROPERTY_FEATURE_FILE_PATH = None
 
 UG_BG_RECS_MATRIX_PATH = None
+
+# binary bundle built by model/compile_model.py, if it is set
+# the raw sources above are not used
+MODEL_BUNDLE_PATH = None
+
+# memory-map arrays of the bundle instead of reading them, the mapped
+# arrays (id maps, sparse matrices) are shared by all server workers
+MODEL_BUNDLE_MMAP = False
+
+# text file containing the path to the current bundle, it overrides
+# MODEL_BUNDLE_PATH. If the check interval (seconds) is set, every worker
+# reloads the model once the pointer starts pointing to a new bundle
+MODEL_POINTER_PATH = None
+MODEL_POINTER_CHECK_INTERVAL = None
+
+# token expected in the X-Admin-Token header of admin calls, e.g. /api/admin/reload/,
+# admin calls are disabled if it is not set
+ADMIN_TOKEN = None
+
+# max number of uids in one call of batch endpoints
+MAX_BATCH_SIZE = 10000
+
+# precomputed responses built by model/materialize_recs.py. Requests with default
+# arguments are answered from it if it is built by the model version in use
+RECS_STORE_PATH = None
+
+# in-process cache of /cluster/recs/ and /item/recs/ responses, it is enabled
+# if the max number of entries or the max total size of responses (bytes) is set.
+# Entries expire after the TTL (seconds) if it is set
+RECS_CACHE_MAX_ENTRIES = None
+RECS_CACHE_MAX_BYTES = None
+RECS_CACHE_TTL = None
+
+# admin requests with the profile=1 arg are run under cProfile. The stats are
+# returned instead of the response or, if the folder is set, dumped to it
+PROFILE_REQUESTS = False
+PROFILE_DIR = None
+
+# call stacks of requests running longer than the threshold (seconds) are sampled
+# every interval (seconds) to a rotating log file, sampling is disabled if it is not set.
+# Every worker process writes its own file, the pid is inserted into the name of the
+# log file, e.g. slow_requests.1234.log
+SLOW_REQUEST_THRESHOLD = None
+SLOW_REQUEST_SAMPLE_INTERVAL = 0.1
+SLOW_REQUEST_MAX_SAMPLES = 10
+SLOW_REQUEST_LOG_PATH = 'slow_requests.log'
+SLOW_REQUEST_LOG_MAX_BYTES = 10 * 1024 * 1024
+SLOW_REQUEST_LOG_BACKUP_COUNT = 5
@@ -31,3 +31,24 @@ class ArgErrorException(BaseApiException):
         d = {"error": self.message, "error_code": self.code, "arg": self.arg_name}
         d.update(self.kwargs)
         return d
+
+
+class AccessDeniedException(BaseApiException):
+    """Exceptions related to access to admin api calls
+    """
+    _default_message = u'access denied'
+    code = 403
+
+
+class ModelReloadInProgressException(BaseApiException):
+    """The model is being reloaded by another call
+    """
+    _default_message = u'model reload is already in progress'
+    code = 409
+
+
+class ModelReloadFailedException(BaseApiException):
+    """The new model can't be loaded, the current one is kept
+    """
+    _default_message = u'model reload has failed, the current model is kept'
+    code = 500
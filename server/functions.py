@@ -10,9 +10,87 @@ def get_abs_path(*args):
     return os.path.abspath(os.path.join(os.path.dirname(__file__), *args))
 
 
+def is_admin_request(config, headers):
+    """ Checks the X-Admin-Token header, admin calls are disabled if ADMIN_TOKEN is not set
+    """
+    admin_token = config.get('ADMIN_TOKEN')
+    return bool(admin_token) and headers.get('X-Admin-Token') == admin_token
+
+
+def run_in_worker(func):
+    """ Calls func in every worker process. uwsgi without lazy-apps loads the app
+        in the master and forks workers, threads started by the master don't
+        exist in workers, so func is called after the fork in this case
+    """
+    try:
+        import uwsgi
+        from uwsgidecorators import postfork
+    except ImportError:
+        func()
+        return
+
+    if uwsgi.opt.get('lazy-apps') in (None, False, b'false', b'0'):
+        postfork(func)
+    else:
+        func()
+
+
 def clean_json_dict_keys(d):
     new_d = {}
     for k, v in d.items():
         _k = int(k) if isinstance(k, np.int32) else k
         new_d[_k] = clean_json_dict_keys(v) if isinstance(v, dict) else v
     return new_d
+
+
+def get_top_not_excluded(ids, scores, exclude_ids, top=None):
+    """ Walks through ids ranked by score and returns the first top
+        ids (and their scores) that are not in exclude_ids
+    """
+    top = top or None
+    if top:
+        # the first top + len(exclude_ids) ids always contain top not excluded ones
+        ids = ids[:top + exclude_ids.size]
+        scores = scores[:top + exclude_ids.size]
+
+    if exclude_ids.size:
+        mask = ~np.isin(ids, exclude_ids)
+        ids, scores = ids[mask], scores[mask]
+    return ids[:top], scores[:top]
+
+
+def get_segment_positions(starts, lengths):
+    """ Positions of segments [start, start + length) of an array placed one after another
+
+    :return: positions and the segment of every position
+    """
+    seg_ids = np.repeat(np.arange(lengths.size), lengths)
+    offsets = np.arange(seg_ids.size) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(starts, lengths) + offsets, seg_ids
+
+
+def get_first_per_segment(mask, seg_ids, top=None):
+    """ The same as get_top_not_excluded, but for many segments of ranked values at once
+
+    :param mask: True for values that can be taken
+    :param seg_ids: sorted segment of every value
+    :return: positions of the first top values of every segment that can be taken
+    """
+    positions = np.flatnonzero(mask)
+    if top:
+        kept_seg_ids = seg_ids[positions]
+        ranks = np.arange(positions.size) - np.searchsorted(kept_seg_ids, kept_seg_ids)
+        positions = positions[ranks < top]
+    return positions
+
+
+def get_top_mask(scores, top):
+    """ Marks top scores of every row, ties are resolved in favour of lower columns
+
+    :param scores: 2d array of scores
+    """
+    kth = -np.partition(-scores, top - 1, axis=1)[:, top - 1:top]
+    greater = scores > kth
+    equal = scores == kth
+    n_left = top - greater.sum(axis=1, keepdims=True)
+    return greater | (equal & (np.cumsum(equal, axis=1) <= n_left))
@@ -0,0 +1,186 @@
+"""
+In-process metrics of the server rendered in the Prometheus text format.
+Every worker process keeps its own metrics.
+"""
+
+import bisect
+import threading
+import time
+
+# upper bounds of histogram buckets, seconds
+DEFAULT_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5
+)
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def format_labels(label_names, label_values):
+    if not label_names:
+        return ""
+    pairs = [
+        '%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in zip(label_names, label_values)
+    ]
+    return "{%s}" % ",".join(pairs)
+
+
+def format_family(name, metric_type, help_text, samples):
+    """ Renders a metric family
+
+    :param samples: list of (name suffix, label names, label values, value)
+    """
+    lines = ["# HELP %s %s" % (name, help_text), "# TYPE %s %s" % (name, metric_type)]
+    for suffix, label_names, label_values, value in samples:
+        lines.append("%s%s%s %s" % (name, suffix, format_labels(label_names, label_values), format_value(value)))
+    return lines
+
+
+class Counter(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._value = 0
+
+    def inc(self, value=1):
+        with self._lock:
+            self._value += value
+
+    def samples(self):
+        return [("", (), (), self._value)]
+
+
+class Gauge(object):
+    def __init__(self):
+        self._value = 0.0
+
+    def set(self, value):
+        self._value = value
+
+    def samples(self):
+        return [("", (), (), self._value)]
+
+
+class Histogram(object):
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self._buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # the last count is for values above all buckets
+        self._counts = [0] * (len(self._buckets) + 1)
+        self._sum = 0.0
+
+    def observe(self, value):
+        i = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+
+    def samples(self):
+        with self._lock:
+            counts, total = list(self._counts), self._sum
+
+        samples = []
+        cumulative = 0
+        for le, count in zip(self._buckets + (float("inf"),), counts):
+            cumulative += count
+            samples.append(("_bucket", ("le",), (format_value(le),), cumulative))
+        samples.append(("_sum", (), (), total))
+        samples.append(("_count", (), (), cumulative))
+        return samples
+
+
+class MetricFamily(object):
+    """ Metrics of the same name and type that differ by label values
+    """
+    def __init__(self, name, metric_type, help_text, label_names, metric_class):
+        self.name = name
+        self.metric_type = metric_type
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._metric_class = metric_class
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def labels(self, *label_values):
+        metric = self._metrics.get(label_values)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.setdefault(label_values, self._metric_class())
+        return metric
+
+    def render(self):
+        samples = []
+        for label_values, metric in sorted(self._metrics.items()):
+            for suffix, extra_names, extra_values, value in metric.samples():
+                samples.append((suffix, self.label_names + extra_names, label_values + extra_values, value))
+        return format_family(self.name, self.metric_type, self.help_text, samples)
+
+
+class MetricsRegistry(object):
+    def __init__(self):
+        self._families = []
+
+    def _add(self, name, metric_type, help_text, label_names, metric_class):
+        family = MetricFamily(name, metric_type, help_text, label_names, metric_class)
+        self._families.append(family)
+        return family
+
+    def counter(self, name, help_text, label_names=()):
+        return self._add(name, "counter", help_text, label_names, Counter)
+
+    def gauge(self, name, help_text, label_names=()):
+        return self._add(name, "gauge", help_text, label_names, Gauge)
+
+    def histogram(self, name, help_text, label_names=()):
+        return self._add(name, "histogram", help_text, label_names, Histogram)
+
+    def render(self):
+        lines = []
+        for family in self._families:
+            lines.extend(family.render())
+        return lines
+
+
+REGISTRY = MetricsRegistry()
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    "api_request_seconds", "Latency of API requests", ("endpoint",)
+)
+REQUESTS = REGISTRY.counter(
+    "api_requests_total", "Number of API requests", ("endpoint", "status")
+)
+STAGE_SECONDS = REGISTRY.histogram(
+    "api_stage_seconds", "Latency of stages of API requests", ("endpoint", "stage")
+)
+RECS_STORE_LOOKUPS = REGISTRY.counter(
+    "recs_store_lookups_total", "Number of lookups of precomputed responses", ("result",)
+)
+MODEL_LOAD_SECONDS = REGISTRY.gauge(
+    "model_load_seconds", "Duration of the last model load per artifact", ("artifact",)
+)
+MODEL_LOADS = REGISTRY.counter(
+    "model_loads_total", "Number of model loads", ("source",)
+)
+
+
+class StageTimer(object):
+    """ Records durations of consecutive stages of a request
+    """
+    def __init__(self, endpoint):
+        self._endpoint = endpoint
+        self._last = time.perf_counter()
+
+    def lap(self, stage):
+        """ Records the time passed since the previous lap as the stage duration
+        """
+        now = time.perf_counter()
+        STAGE_SECONDS.labels(self._endpoint, stage).observe(now - self._last)
+        self._last = now
+
+
+class NullStageTimer(object):
+    def lap(self, stage):
+        pass
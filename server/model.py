@@ -0,0 +1,190 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+from scipy.io import mmread
+
+from misc.common import parse_ug_data, parse_bg_data, parse_group_features
+from server.bundle import ModelBundle, save_bundle
+from server.data_provider import UserDataProvider, BookingDataProvider, ItemDataProvider, ItemFeatureDataProvider
+from server.metrics import MODEL_LOAD_SECONDS, MODEL_LOADS
+from server.recommender import ClusterRecommender, PopItemRecommender, CBItemRecommender
+
+logger = logging.getLogger(__name__)
+
+
+def observe_load(artifact, start):
+    """Records the load time of the artifact started at start and returns the current time
+    """
+    now = time.time()
+    MODEL_LOAD_SECONDS.labels(artifact).set(now - start)
+    return now
+
+
+class LoadContext(object):
+    """Raw sources of the model shared by the data providers. Every source is read
+    and parsed once, the sources are loaded concurrently by a thread pool.
+    Use it as a context manager, get waits for the source to be loaded.
+    """
+    def __init__(self, config):
+        self.config = config
+        self._executor = None
+        self._futures = {}
+
+    def _load_user_clusters(self):
+        with open(self.config['UG_FILE_PATH']) as f:
+            lines = f.readlines()
+        return parse_ug_data(lines), parse_group_features(lines)
+
+    def _load_booking_clusters(self):
+        with open(self.config['BG_FILE_PATH']) as f:
+            lines = f.readlines()
+        _, bg_iids = parse_bg_data(lines)
+        return bg_iids, parse_group_features(lines)
+
+    def _get_loaders(self):
+        return {
+            "user_clusters": self._load_user_clusters,
+            "booking_clusters": self._load_booking_clusters,
+            "user_features": lambda: pd.read_csv(self.config['USER_FEATURE_FILE_PATH']),
+            "bookings": lambda: pd.read_csv(self.config['BOOKING_FEATURE_FILE_PATH']),
+            "properties": lambda: pd.read_csv(self.config['PROPERTY_FILE_PATH']),
+            "property_features": lambda: pd.read_csv(self.config['PROPERTY_FEATURE_FILE_PATH']),
+            "ug_bg_recs_m": lambda: mmread(self.config['UG_BG_RECS_MATRIX_PATH']).tocsr(),
+        }
+
+    @staticmethod
+    def _load(source, loader):
+        start = time.time()
+        res = loader()
+        logger.info(u"Source %s has been loaded in %.3fs", source, observe_load(source, start) - start)
+        return res
+
+    def __enter__(self):
+        loaders = self._get_loaders()
+        self._executor = ThreadPoolExecutor(len(loaders))
+        self._futures = {
+            source: self._executor.submit(self._load, source, loader) for source, loader in loaders.items()
+        }
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._executor.shutdown()
+
+    def get(self, source):
+        """Returns the parsed source, an error of loading is raised here
+        """
+        return self._futures[source].result()
+
+
+class Model(object):
+    """Data providers and recommenders of one version of the model
+    """
+    def __init__(self, version, user_dp, booking_dp, item_dp, item_feature_dp, bg_recommender, item_cb_recommender):
+        self.version = version
+
+        self.user_dp = user_dp
+        self.booking_dp = booking_dp
+        self.item_dp = item_dp
+        self.item_feature_dp = item_feature_dp
+
+        self.bg_recommender = bg_recommender
+        self.item_cb_recommender = item_cb_recommender
+
+    @staticmethod
+    def _load_item_recommenders(booking_dp, item_dp, item_feature_dp):
+        """Ranks items of booking clusters by popularity and builds the content-based recommender,
+        both are stored in the bundle, so it is done only for raw sources
+        """
+        start = time.time()
+        item_pop_recommender = PopItemRecommender.load(booking_dp, item_dp)
+        logger.info(u"Item popularity based recommender has been initialized")
+
+        item_dp.prepare_bg_iid_ranking(*item_pop_recommender.get_ranking())
+        logger.info(u"Items of booking clusters have been ranked by popularity")
+
+        item_cb_recommender = CBItemRecommender.load(booking_dp, item_dp, item_feature_dp)
+        logger.info(u"Item content-based recommender has been initialized")
+        observe_load("item_recommenders", start)
+        return item_cb_recommender
+
+    def dump(self, path):
+        save_bundle(path, self.version, {
+            "user_dp": self.user_dp.dump(),
+            "booking_dp": self.booking_dp.dump(),
+            "item_dp": self.item_dp.dump(),
+            "item_feature_dp": self.item_feature_dp.dump(),
+            "bg_recommender": self.bg_recommender.dump(),
+            "item_cb_recommender": self.item_cb_recommender.dump(),
+        })
+
+    @staticmethod
+    def load(config, version=None):
+        """Loads the model from the raw sources listed in the config
+
+        :param version: version of the model, by default it is made of the load time,
+            so models of different loads never share cached responses
+        """
+        start = step_start = time.time()
+        if version is None:
+            version = "raw-%s" % datetime.utcnow().strftime("%Y%m%d%H%M%S%f")
+
+        # providers wait only for their own sources, the others are loaded meanwhile
+        with LoadContext(config) as context:
+            user_dp = UserDataProvider.load(context)
+            logger.info(u"User data provider has been initialized")
+            step_start = observe_load("user_dp", step_start)
+
+            item_dp = ItemDataProvider.load(context)
+            logger.info(u"Item data provider has been initialized")
+            step_start = observe_load("item_dp", step_start)
+
+            booking_dp = BookingDataProvider.load(context, item_dp)
+            logger.info(u"Booking data provider has been initialized")
+            step_start = observe_load("booking_dp", step_start)
+
+            item_feature_dp = ItemFeatureDataProvider.load(context)
+            logger.info(u"Item feature data provider has been initialized")
+            step_start = observe_load("item_feature_dp", step_start)
+
+            bg_recommender = ClusterRecommender.load(context, user_dp, booking_dp, item_dp)
+            logger.info(u"Personalized booking clusters recommender has been initialized")
+            observe_load("bg_recommender", step_start)
+
+        item_cb_recommender = Model._load_item_recommenders(booking_dp, item_dp, item_feature_dp)
+        model = Model(version, user_dp, booking_dp, item_dp, item_feature_dp, bg_recommender, item_cb_recommender)
+        MODEL_LOADS.labels("raw").inc()
+        logger.info(u"Model has been loaded from raw sources in %.3fs", observe_load("total", start) - start)
+        return model
+
+    @staticmethod
+    def load_bundle(path, mmap_arrays=False):
+        """Loads the model from a bundle created by Model.dump
+
+        :param path: a path to the bundle
+        :param mmap_arrays: if True, arrays of the bundle are memory-mapped
+            and shared by all processes using the same bundle file
+        """
+        start = time.time()
+
+        bundle = ModelBundle.load(path, mmap_arrays)
+        step_start = observe_load("bundle", start)
+
+        user_dp = UserDataProvider.load_bundle(bundle)
+        item_dp = ItemDataProvider.load_bundle(bundle)
+        booking_dp = BookingDataProvider.load_bundle(bundle)
+        item_feature_dp = ItemFeatureDataProvider.load_bundle(bundle)
+        bg_recommender = ClusterRecommender.load_bundle(bundle, user_dp, booking_dp, item_dp)
+        item_cb_recommender = CBItemRecommender.load_bundle(bundle, booking_dp, item_dp, item_feature_dp)
+        observe_load("providers", step_start)
+
+        model = Model(
+            bundle.version, user_dp, booking_dp, item_dp, item_feature_dp, bg_recommender, item_cb_recommender
+        )
+        MODEL_LOADS.labels("bundle").inc()
+        logger.info(
+            u"Model %s has been loaded from %s in %.3fs", model.version, path, observe_load("total", start) - start
+        )
+        return model
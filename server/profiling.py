@@ -0,0 +1,113 @@
+"""
+Opt-in profiling of the live server: deterministic profiling of single
+admin requests and call-stack samples of slow requests.
+"""
+
+import cProfile
+import io
+import logging
+import logging.handlers
+import os
+import pstats
+import sys
+import threading
+import time
+import traceback
+
+
+def format_profile_stats(profiler, sort_by="cumulative", top=50):
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats(sort_by).print_stats(top)
+    return stream.getvalue()
+
+
+def run_profiled(func):
+    """ Calls func under cProfile
+
+    :return: the result of func and the profiler
+    """
+    profiler = cProfile.Profile()
+    rv = profiler.runcall(func)
+    return rv, profiler
+
+
+def get_worker_log_path(log_path, pid=None):
+    """ Inserts the pid into the file name, e.g. slow.log -> slow.1234.log
+    """
+    root, ext = os.path.splitext(log_path)
+    return "%s.%s%s" % (root, pid or os.getpid(), ext)
+
+
+class SlowRequestWatchdog(object):
+    """ Samples call stacks of requests running longer than the threshold
+    and writes them to a rotating file. Requests register themselves, the
+    stacks are taken by a background thread, so fast requests don't pay for it.
+    Rotation isn't safe between processes, so every worker process writes
+    its own file, the pid is inserted into the name.
+    """
+    def __init__(self, threshold, log_path, interval=0.1, max_samples=10, max_bytes=10 * 1024 * 1024,
+                 backup_count=5):
+        """
+        :param threshold: seconds a request runs before its stack is sampled
+        :param log_path: path to the file of samples
+        :param interval: seconds between two samples of the same request
+        :param max_samples: max number of samples per request
+        """
+        self.threshold = threshold
+        self.log_path = log_path
+        self.interval = interval
+        self.max_samples = max_samples
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+
+        # thread id -> [start time, request description, number of samples]
+        self._requests = {}
+        self._thread = None
+
+        self._logger = logging.getLogger("server.slow_requests")
+        self._logger.propagate = False
+        self._logger.setLevel(logging.INFO)
+
+    def _setup_handler(self):
+        # the file is opened by the process that samples the requests
+        handler = logging.handlers.RotatingFileHandler(
+            get_worker_log_path(self.log_path), maxBytes=self.max_bytes, backupCount=self.backup_count
+        )
+        handler.setFormatter(logging.Formatter('%(asctime)s:%(process)s: %(message)s'))
+        self._logger.handlers = [handler]
+
+    def request_started(self, description):
+        self._requests[threading.get_ident()] = [time.time(), description, 0]
+
+    def request_finished(self):
+        self._requests.pop(threading.get_ident(), None)
+
+    def _sample(self):
+        now = time.time()
+        frames = None
+        for thread_id, record in list(self._requests.items()):
+            start, description, n_samples = record
+            if now - start < self.threshold or n_samples >= self.max_samples:
+                continue
+
+            frames = frames or sys._current_frames()
+            frame = frames.get(thread_id)
+            if frame is None:
+                continue
+
+            record[2] += 1
+            self._logger.info(
+                u"%s has been running for %.3fs, sample %s:\n%s",
+                description, now - start, record[2], "".join(traceback.format_stack(frame))
+            )
+
+    def _watch(self):
+        while True:
+            time.sleep(self.interval)
+            self._sample()
+
+    def start(self):
+        self._setup_handler()
+        self._thread = threading.Thread(target=self._watch, name="slow-request-watchdog")
+        self._thread.daemon = True
+        self._thread.start()
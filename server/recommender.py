@@ -1,69 +1,166 @@
 import logging
 
 import numpy as np
-from scipy.io import mmread
-from scipy.sparse import csr_matrix
-from sklearn.preprocessing import binarize, normalize
+from scipy.sparse import csr_matrix, vstack
+from sklearn.preprocessing import normalize
+
+from server.bundle import csr_to_arrays, arrays_to_csr
+from server.functions import get_segment_positions, get_first_per_segment, get_top_mask
 
 logger = logging.getLogger(__name__)
 
+# number of users scored at once by batch methods
+BATCH_CHUNK_SIZE = 256
+
 
 class ClusterRecommender(object):
-    def __init__(self, ug_bg_recs_m, user_dp, booking_dp, item_dp):
+    def __init__(self, ug_bg_recs_m, user_dp, booking_dp, item_dp, ranking=None):
+        """
+        :param ranking: CSR-like arrays (indptr, bg_ids, scores) of booking clusters
+            of every user cluster sorted by score, they are built from ug_bg_recs_m if None
+        """
         self.ug_bg_recs_m = ug_bg_recs_m
         self.booking_dp =booking_dp
         self.user_dp = user_dp
         self.item_dp = item_dp
 
-    def get_recs(self, ug_id, iid_recs, top_clusters=None, min_iid_per_bg=None):
-        bg_recs_row = self.ug_bg_recs_m[ug_id]
-        bg_mask = binarize(
-            self.item_dp.get_iid_per_bg_row(binarize(iid_recs), min_iid_per_bg)
+        if ranking is None:
+            ranking = self._prepare_ranking(ug_bg_recs_m)
+        self._rank_indptr, self._rank_bg_ids, self._rank_scores = ranking
+
+    @staticmethod
+    def _prepare_ranking(ug_bg_recs_m):
+        # booking clusters of every user cluster sorted by score, ties are broken by bg_id
+        m = csr_matrix(ug_bg_recs_m)
+        rows = np.repeat(np.arange(m.shape[0]), np.diff(m.indptr))
+        nonzero = m.data != 0
+        rows, bg_ids, scores = rows[nonzero], m.indices[nonzero], m.data[nonzero]
+
+        order = np.lexsort((bg_ids, -scores, rows))
+        indptr = np.r_[0, np.cumsum(np.bincount(rows, minlength=m.shape[0]))]
+        return indptr, bg_ids[order].astype(np.int32), scores[order]
+
+    def _get_ranked_candidates(self, ug_id, get_iid_per_bg, top_clusters=None):
+        """ Walks through booking clusters of the user cluster ranked by score and returns
+            the first top_clusters ones having items to recommend
+
+        :param get_iid_per_bg: function returning numbers of items to recommend for an array of bg_ids
+        :return: arrays of bg_ids and their scores
+        """
+        start, end = self._rank_indptr[ug_id], self._rank_indptr[ug_id + 1]
+        bg_ids, scores = self._rank_bg_ids[start:end], self._rank_scores[start:end]
+        if not top_clusters:
+            mask = get_iid_per_bg(bg_ids) > 0
+            return bg_ids[mask], scores[mask]
+
+        # clusters are checked in growing chunks, usually the first chunk is enough
+        chunks = []
+        n_found = 0
+        pos, chunk_size = 0, top_clusters
+        while pos < bg_ids.size and n_found < top_clusters:
+            chunk = slice(pos, pos + chunk_size)
+            mask = get_iid_per_bg(bg_ids[chunk]) > 0
+            chunks.append((bg_ids[chunk][mask], scores[chunk][mask]))
+            n_found += chunks[-1][0].size
+            pos, chunk_size = pos + chunk_size, chunk_size * 2
+
+        if not chunks:
+            return bg_ids[:0], scores[:0]
+        return np.concatenate([c[0] for c in chunks])[:top_clusters], \
+            np.concatenate([c[1] for c in chunks])[:top_clusters]
+
+    def get_recs(self, ug_id, exclude_cols, top_clusters=None, min_iid_per_bg=None):
+        """
+        :return: arrays of recommended bg_ids and their scores sorted by score
+        """
+        excluded_bg_ids = self.item_dp.get_excluded_bg_ids(exclude_cols)
+        return self._get_ranked_candidates(
+            ug_id,
+            lambda bg_ids: self.item_dp.get_iid_per_bgs(bg_ids, excluded_bg_ids, min_iid_per_bg),
+            top_clusters
         )
-        bg_recs_row = bg_recs_row.multiply(bg_mask)
 
-        if top_clusters is not None:
-            arg_ids = np.argsort(bg_recs_row.data)[-top_clusters:]
-            rows, cols = bg_recs_row.nonzero()
-            bg_recs_row = csr_matrix(
-                (bg_recs_row.data[arg_ids], (rows[arg_ids], cols[arg_ids])),
-                shape=bg_recs_row.shape
-            )
-        return bg_recs_row
+    def get_recs_batch(self, ug_ids, exclude_m, top_clusters=None, min_iid_per_bg=None):
+        """ The same as get_recs, but for several users at once. The ranked booking
+            clusters of all users are gathered and filtered together
+
+        :param ug_ids: user cluster per user
+        :param exclude_m: binary users x items matrix of items to exclude
+        :return: CSR-like arrays (indptr, bg_ids, scores), booking clusters
+            of the i-th user are bg_ids[indptr[i]:indptr[i + 1]] sorted by score
+        """
+        ug_ids = np.asarray(ug_ids, dtype=int)
+        iid_per_bg_m = self.item_dp.get_iid_per_bg_matrix(exclude_m, min_iid_per_bg)
+
+        starts = self._rank_indptr[ug_ids]
+        positions, rows = get_segment_positions(starts, self._rank_indptr[ug_ids + 1] - starts)
+        bg_ids = self._rank_bg_ids[positions]
+
+        kept = get_first_per_segment(iid_per_bg_m[rows, bg_ids] > 0, rows, top_clusters)
+        indptr = np.r_[0, np.cumsum(np.bincount(rows[kept], minlength=ug_ids.size))]
+        return indptr, bg_ids[kept], self._rank_scores[positions[kept]]
+
+    def dump(self):
+        arrays = csr_to_arrays(self.ug_bg_recs_m, "ug_bg_recs_m")
+        arrays.update({
+            "rank_indptr": self._rank_indptr,
+            "rank_bg_ids": self._rank_bg_ids,
+            "rank_scores": self._rank_scores,
+        })
+        return arrays
 
     @staticmethod
-    def load(config, user_dp, booking_dp, item_dp):
-        recs_m_path = config['UG_BG_RECS_MATRIX_PATH']
-
-        ug_bg_recs_m = mmread(recs_m_path).tocsr()
-        logger.info("Cluster recs matrix has been load")
+    def load(context, user_dp, booking_dp, item_dp):
+        return ClusterRecommender(context.get("ug_bg_recs_m"), user_dp, booking_dp, item_dp)
 
-        return ClusterRecommender(ug_bg_recs_m, user_dp, booking_dp, item_dp)
+    @staticmethod
+    def load_bundle(bundle, user_dp, booking_dp, item_dp):
+        arrays = bundle.get_group("bg_recommender")
+        ranking = arrays["rank_indptr"], arrays["rank_bg_ids"], arrays["rank_scores"]
+        return ClusterRecommender(arrays_to_csr(arrays, "ug_bg_recs_m"), user_dp, booking_dp, item_dp, ranking)
 
 
 class PopItemRecommender(object):
     def __init__(self, booking_dp, item_dp):
         self.booking_dp = booking_dp
         self.item_dp = item_dp
+        self._prepare_ranking()
 
-    def get_recs(self, uid, top_items=None):
-        active_iids = self.item_dp.get_active_iids()
-        booked_iids = self.booking_dp.get_iids_for_uid(uid)
-        if booked_iids:
-            active_iids = active_iids.difference(booked_iids)
+    def _prepare_ranking(self):
+        scores = np.full(self.item_dp.n_iids, 1e-6)  # constant to guarantee nnz
 
         obs_per_iid = self.booking_dp.get_obs_per_iid()
-        obs_per_iid = obs_per_iid[obs_per_iid.index.isin(active_iids)]
-        unobserved_iids = list(active_iids.difference(obs_per_iid.index))
+        cols = np.array([self.item_dp.iid_to_col.get(iid, -1) for iid in obs_per_iid.index], dtype=int)
+        scores[cols[cols >= 0]] = obs_per_iid.values[cols >= 0]
+
+        # active items ordered by popularity, ties are resolved by column id
+        active_cols = np.where(self.item_dp.active_col_mask)[0]
+        ranked_cols = active_cols[np.argsort(-scores[active_cols], kind="mergesort")]
+
+        self._ranked_cols = ranked_cols.astype(np.int32)
+        self._ranked_scores = scores[ranked_cols]
 
-        # iids available for recs
-        iids = np.r_[obs_per_iid.index, unobserved_iids]
-        # scores of iids
-        scores = np.r_[obs_per_iid.values, [1e-6] * len(unobserved_iids)]  # constant to guarantee nnz
+    def get_ranking(self):
+        """
+        :return: arrays of active item columns ordered by popularity and their scores
+        """
+        return self._ranked_cols, self._ranked_scores
+
+    def get_recs(self, uid, top_items=None):
+        top_items = top_items or None
+        booked_cols = self.booking_dp.get_iid_cols_for_uid(uid)
 
-        arg_ids = np.argsort(scores)[-top_items:][::-1] if top_items else np.argsort(scores)[::-1]
-        recs = self.item_dp.get_score_per_iid_row(iids[arg_ids], scores[arg_ids])
-        return recs
+        # top_items + n_booked best items always contain top_items not booked ones
+        n_candidates = top_items + booked_cols.size if top_items else None
+        cols = self._ranked_cols[:n_candidates]
+        scores = self._ranked_scores[:n_candidates]
+
+        if booked_cols.size:
+            mask = ~np.isin(cols, booked_cols)
+            cols, scores = cols[mask], scores[mask]
+
+        cols, scores = cols[:top_items], scores[:top_items]
+        return csr_matrix((scores, (np.zeros(cols.size), cols)), shape=(1, self.item_dp.n_iids))
 
     @staticmethod
     def load(booking_dp, item_dp):
@@ -71,26 +168,81 @@ class PopItemRecommender(object):
 
 
 class CBItemRecommender(object):
-    def __init__(self, booking_dp, item_dp, item_feature_dp):
+    def __init__(self, booking_dp, item_dp, item_feature_dp, norm_if_m=None, active_mask=None):
+        """
+        :param norm_if_m: normalized items x features matrix, rows are aligned with item columns
+        :param active_mask: mask of item columns that can be recommended,
+            norm_if_m and active_mask are built from the data providers if None
+        """
         self.booking_dp = booking_dp
         self.item_dp = item_dp
         self.item_feature_dp = item_feature_dp
 
-    def get_recs(self, uid, top_items=None):
-        active_iids = self.item_dp.get_active_iids()
-        booked_iids = self.booking_dp.get_iids_for_uid(uid)
-        if booked_iids:
-            active_iids = active_iids.difference(booked_iids)
+        if norm_if_m is None:
+            norm_if_m, active_mask = self._prepare_item_feature_matrix(item_dp, item_feature_dp)
+        self._norm_if_m = norm_if_m
+        self._active_mask = active_mask
+
+    @staticmethod
+    def _prepare_item_feature_matrix(item_dp, item_feature_dp):
+        iids = [item_dp.col_to_iid[col] for col in range(item_dp.n_iids)]
+        has_features = np.array([item_feature_dp.has_iid_features(iid) for iid in iids], dtype=bool)
 
-        active_iids = np.array(list(active_iids))
-        uf_m = normalize(self.item_feature_dp.get_uids_feature_matrix([uid]))
-        if_m = normalize(self.item_feature_dp.get_iids_feature_matrix(active_iids))
-        scores = uf_m.dot(if_m.T).todense().A1
+        # rows are aligned with item columns, items without features get the extra zero row
+        if_m = item_feature_dp.get_iids_feature_matrix(np.array(iids)[has_features])
+        row_ids = np.full(len(iids), if_m.shape[0], dtype=int)
+        row_ids[has_features] = np.arange(if_m.shape[0])
+        if_m = vstack([if_m, csr_matrix((1, if_m.shape[1]))]).tocsr()[row_ids]
 
-        arg_ids = np.argsort(scores)[-top_items:][::-1] if top_items else np.argsort(scores)[::-1]
-        recs = self.item_dp.get_score_per_iid_row(active_iids[arg_ids], scores[arg_ids])
-        return recs
+        # items without features can't be scored, so they are never recommended
+        return normalize(if_m), item_dp.active_col_mask & has_features
+
+    def get_recs(self, uid, top_items=None):
+        return self._get_recs_chunk([uid], top_items)
+
+    def _get_recs_chunk(self, uids, top_items):
+        n_iids = self.item_dp.n_iids
+        uf_m = self.item_feature_dp.get_uids_feature_matrix(uids).toarray()
+        norms = np.sqrt((uf_m * uf_m).sum(axis=1, keepdims=True))
+        uf_m /= np.where(norms > 0, norms, 1)
+        # a sparse x dense product gives the same scores whatever the number of users
+        scores = np.ascontiguousarray(self._norm_if_m.dot(uf_m.T).T)
+
+        # items that aren't candidates never reach the top
+        scores[:, ~self._active_mask] = -np.inf
+        for row_id, uid in enumerate(uids):
+            scores[row_id, self.booking_dp.get_iid_cols_for_uid(uid)] = -np.inf
+
+        mask = np.isfinite(scores)
+        if top_items and top_items < n_iids:
+            mask &= get_top_mask(scores, top_items)
+        rows, cols = np.nonzero(mask)
+        indptr = np.r_[0, np.cumsum(np.bincount(rows, minlength=len(uids)))]
+        return csr_matrix((scores[rows, cols], cols, indptr), shape=(len(uids), n_iids))
+
+    def get_recs_batch(self, uids, top_items=None):
+        """ The same as get_recs, but for several users at once
+
+        :return: users x items matrix, a row per uid
+        """
+        chunks = [
+            self._get_recs_chunk(uids[start:start + BATCH_CHUNK_SIZE], top_items)
+            for start in range(0, len(uids), BATCH_CHUNK_SIZE)
+        ]
+        return vstack(chunks).tocsr() if chunks else csr_matrix((0, self.item_dp.n_iids))
+
+    def dump(self):
+        arrays = csr_to_arrays(self._norm_if_m, "norm_if_m")
+        arrays["active_mask"] = self._active_mask
+        return arrays
 
     @staticmethod
     def load(booking_dp, item_dp, item_feature_dp):
         return CBItemRecommender(booking_dp, item_dp, item_feature_dp)
+
+    @staticmethod
+    def load_bundle(bundle, booking_dp, item_dp, item_feature_dp):
+        arrays = bundle.get_group("item_cb_recommender")
+        return CBItemRecommender(
+            booking_dp, item_dp, item_feature_dp, arrays_to_csr(arrays, "norm_if_m"), arrays["active_mask"]
+        )
@@ -0,0 +1,65 @@
+"""
+Store of precomputed JSON responses built by model/materialize_recs.py.
+The responses of every endpoint are kept as one byte array plus offsets,
+the uids are sorted, so a lookup is a binary search without any per-uid
+python objects. The store is saved as a bundle and can be memory-mapped.
+"""
+
+import numpy as np
+
+from server.bundle import ModelBundle, ArrayIdIndex, save_bundle
+
+CLUSTER_RECS = "cluster"
+ITEM_RECS = "item"
+
+
+def payloads_to_arrays(payloads):
+    """ Converts {uid: JSON bytes, ...} to sorted uids, offsets and concatenated payloads
+    """
+    uids = sorted(payloads)
+    offsets = np.zeros(len(uids) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(payloads[uid]) for uid in uids])
+    return {
+        "uids": np.array(uids, dtype=np.str_),
+        "offsets": offsets,
+        "data": np.frombuffer(b"".join(payloads[uid] for uid in uids), dtype=np.uint8),
+    }
+
+
+def save_recs_store(path, version, endpoint_payloads):
+    """
+    :param path: a path to the store file
+    :param version: version of the model the responses are computed by
+    :param endpoint_payloads: {endpoint: {uid: JSON bytes, ...}, ...}
+    """
+    save_bundle(path, version, {
+        endpoint: payloads_to_arrays(payloads) for endpoint, payloads in endpoint_payloads.items()
+    })
+
+
+class RecsStore(object):
+    def __init__(self, version, endpoint_arrays):
+        self.version = version
+        self._endpoints = {
+            endpoint: (ArrayIdIndex(arrays["uids"]), arrays["offsets"], arrays["data"])
+            for endpoint, arrays in endpoint_arrays.items()
+        }
+
+    def get(self, endpoint, uid):
+        """ Returns the JSON response (bytes) stored for the uid or None
+        """
+        if endpoint not in self._endpoints:
+            return None
+
+        uid_to_pos, offsets, data = self._endpoints[endpoint]
+        pos = uid_to_pos.get(uid)
+        if pos is None:
+            return None
+        return data[offsets[pos]:offsets[pos + 1]].tobytes()
+
+    @staticmethod
+    def load(path, mmap_arrays=False):
+        bundle = ModelBundle.load(path, mmap_arrays)
+        return RecsStore(bundle.version, {
+            endpoint: bundle.get_group(endpoint) for endpoint in (CLUSTER_RECS, ITEM_RECS)
+        })
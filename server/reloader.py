@@ -0,0 +1,120 @@
+import logging
+import os
+import threading
+import time
+
+from server.exceptions import ModelReloadFailedException
+from server.model import Model
+from server.recs_store import RecsStore
+
+logger = logging.getLogger(__name__)
+
+
+def read_model_pointer(pointer_path):
+    """ Reads the path to the current model bundle from a pointer file.
+    A relative path is resolved against the folder of the pointer file.
+    """
+    with open(pointer_path) as f:
+        bundle_path = f.read().strip()
+    return os.path.join(os.path.dirname(os.path.abspath(pointer_path)), bundle_path)
+
+
+def load_model(config):
+    """ Loads the model the config points to: the bundle from the pointer
+    file, the bundle from MODEL_BUNDLE_PATH or the raw sources
+    """
+    bundle_path = config.get('MODEL_BUNDLE_PATH')
+    if config.get('MODEL_POINTER_PATH'):
+        bundle_path = read_model_pointer(config['MODEL_POINTER_PATH'])
+
+    if bundle_path:
+        return Model.load_bundle(bundle_path, config.get('MODEL_BUNDLE_MMAP', False))
+    return Model.load(config)
+
+
+def load_recs_store(config):
+    """ Loads the store of precomputed responses if RECS_STORE_PATH is set
+    """
+    if config.get('RECS_STORE_PATH'):
+        return RecsStore.load(config['RECS_STORE_PATH'], config.get('MODEL_BUNDLE_MMAP', False))
+    return None
+
+
+class ModelReloader(object):
+    """ Builds a new model in the background and atomically swaps it with
+    the model of the app. Requests that have already taken the old model
+    finish with it, its memory is released once they are done.
+    """
+    def __init__(self, app):
+        self.app = app
+        self._lock = threading.Lock()
+        self._watcher = None
+
+    def _reload(self):
+        """ Loads and swaps the model, the lock has to be acquired by the caller
+
+        :return: True if the new model is in use, False if it can't be loaded
+        """
+        try:
+            model = load_model(self.app.config)
+            recs_store = load_recs_store(self.app.config)
+            self.app.model = model
+            self.app.recs_store = recs_store
+            # the version is a part of cache keys, old entries are dropped to free memory
+            if getattr(self.app, 'recs_cache', None) is not None:
+                self.app.recs_cache.clear()
+            logger.info(u"Model has been swapped to version %s", model.version)
+            return True
+        except Exception:
+            logger.exception(u"Model reload has failed, version %s is kept", self.app.model.version)
+            return False
+        finally:
+            self._lock.release()
+
+    def reload(self, wait=False):
+        """ Starts reloading the model
+
+        :param wait: if True, returns only when the new model is in use and
+        raises ModelReloadFailedException if it can't be loaded
+        :return: False if another reload is in progress, True otherwise
+        """
+        if not self._lock.acquire(False):
+            return False
+
+        if wait:
+            if not self._reload():
+                raise ModelReloadFailedException()
+        else:
+            thread = threading.Thread(target=self._reload, name="model-reloader")
+            thread.daemon = True
+            thread.start()
+        return True
+
+    def _watch(self, pointer_path, interval):
+        last_bundle_path = read_model_pointer(pointer_path)
+        while True:
+            time.sleep(interval)
+            try:
+                bundle_path = read_model_pointer(pointer_path)
+            except (IOError, OSError) as e:
+                logger.warning(u"Model pointer can't be read: %s", e)
+                continue
+
+            if bundle_path == last_bundle_path or not self._lock.acquire(False):
+                continue
+
+            logger.info(u"Model pointer has been changed to %s", bundle_path)
+            # a failed bundle, e.g. a partially written one, is tried again on the next check
+            if self._reload():
+                last_bundle_path = bundle_path
+
+    def start_watching(self, pointer_path, interval):
+        """ Starts a thread reloading the model every time the pointer file
+        starts pointing to a new bundle
+        """
+        self._watcher = threading.Thread(
+            target=self._watch, args=(pointer_path, interval), name="model-pointer-watcher"
+        )
+        self._watcher.daemon = True
+        self._watcher.start()
+        logger.info(u"Watching model pointer %s every %ss", pointer_path, interval)
@@ -0,0 +1,16 @@
+import numpy as np
+import pytest
+from scipy.sparse import random as sparse_random
+
+
+def assert_same_matrix(actual, expected):
+    """ Checks that sparse matrices have the same shape, nonzero values and pattern
+    """
+    assert actual.shape == expected.shape
+    np.testing.assert_array_equal(actual.toarray() != 0, expected.toarray() != 0)
+    np.testing.assert_allclose(actual.toarray(), expected.toarray())
+
+
+@pytest.fixture
+def ui_matrix():
+    return sparse_random(90, 40, density=0.1, format="csr", random_state=0)
@@ -0,0 +1,38 @@
+import json
+from collections import namedtuple
+
+from server.api import get_cached_response
+from server.app import APIApp
+from server.cache import LRUCache
+
+FakeModel = namedtuple("FakeModel", ["version"])
+
+
+def test_cached_response_uses_one_model():
+    app = APIApp(__name__)
+    app.recs_cache = LRUCache(max_entries=10)
+    old_model, new_model = FakeModel("old"), FakeModel("new")
+    app.model = old_model
+
+    def get_result(model):
+        # a reload swaps the model while the response is computed
+        app.model = new_model
+        return {"model_version": model.version}
+
+    with app.test_request_context("/api/cluster/recs/"):
+        response = get_cached_response(old_model, ("key",), get_result)
+
+    assert json.loads(response.decode("utf-8")) == {"model_version": "old"}
+    assert app.recs_cache.get(("key", "old")) == response
+    assert app.recs_cache.get(("key", "new")) is None
+
+
+def test_cached_response_size_is_in_bytes():
+    app = APIApp(__name__)
+    app.recs_cache = LRUCache(max_bytes=1000)
+
+    with app.test_request_context("/api/item/recs/"):
+        response = get_cached_response(FakeModel("v1"), ("key",), lambda model: {"name": u"\u0416" * 10})
+
+    assert isinstance(response, bytes)
+    assert app.recs_cache.stats()["bytes"] == len(response)
@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from server.bundle import ModelBundle, ArrayIdIndex, save_bundle, index_to_arrays, arrays_to_index
+
+
+def get_groups():
+    return {
+        "g": {
+            "ids": np.array(["a", "bb", "ccc"]),
+            "int8": np.arange(3, dtype=np.int8),
+            "int32": np.arange(5, dtype=np.int32),
+            "int64": np.arange(7, dtype=np.int64),
+            "float64": np.linspace(0, 1, 11),
+            "mask": np.array([True, False, True]),
+            "matrix": np.arange(12, dtype=np.float32).reshape(3, 4),
+            "fortran": np.asfortranarray(np.arange(6, dtype=np.float64).reshape(2, 3)),
+            "empty": np.array([], dtype=np.int32),
+            "scalar": np.array(42),
+        },
+        "h": {
+            "ids": np.array(["x"]),
+        },
+    }
+
+
+@pytest.mark.parametrize("mmap_arrays", [False, True])
+def test_round_trip(tmp_path, mmap_arrays):
+    path = str(tmp_path / "model.npz")
+    groups = get_groups()
+    save_bundle(path, "v1", groups)
+
+    bundle = ModelBundle.load(path, mmap_arrays)
+    assert bundle.version == "v1"
+    for group, arrays in groups.items():
+        loaded = bundle.get_group(group)
+        assert sorted(loaded) == sorted(arrays)
+        for name, arr in arrays.items():
+            assert loaded[name].dtype == arr.dtype
+            assert loaded[name].shape == arr.shape
+            np.testing.assert_array_equal(loaded[name], arr)
+
+
+def test_mmap_arrays_are_aligned(tmp_path):
+    path = str(tmp_path / "model.npz")
+    save_bundle(path, "v1", get_groups())
+
+    bundle = ModelBundle.load(path, mmap_arrays=True)
+    for arr in bundle.get_group("g").values():
+        assert arr.flags["ALIGNED"]
+        assert not arr.flags["WRITEABLE"] or arr.size == 0
+
+
+def test_bundle_is_npz(tmp_path):
+    path = str(tmp_path / "model.npz")
+    save_bundle(path, "v1", get_groups())
+
+    with np.load(path, allow_pickle=False) as npz:
+        np.testing.assert_array_equal(npz["g.int64"], np.arange(7))
+        assert str(npz["version"]) == "v1"
+
+
+def test_id_index():
+    index = arrays_to_index(index_to_arrays({"b": 5, "a": 7, "ccc": 1}, "obj"), "obj")
+    assert len(index) == 3
+    assert index["a"] == 7
+    assert index.get("ccc") == 1
+    assert "b" in index
+    assert sorted(index.items()) == [("a", 7), ("b", 5), ("ccc", 1)]
+
+
+def test_id_index_positions():
+    index = ArrayIdIndex(np.array(["a", "b", "c"]))
+    assert [index.get(obj_id) for obj_id in "abc"] == [0, 1, 2]
+
+
+@pytest.mark.parametrize("obj_id", ["", "aa", "abcd", "cccc" * 100, 1, 1.5, None, b"a"])
+def test_id_index_unknown_keys(obj_id):
+    index = ArrayIdIndex(np.array(["a", "b", "ccc"]), np.array([1, 2, 3]))
+    assert index.get(obj_id) is None
+    assert index.get(obj_id, -1) == -1
+    assert obj_id not in index
+    with pytest.raises(KeyError):
+        index[obj_id]
+
+
+def test_id_index_empty():
+    index = arrays_to_index(index_to_arrays({}, "obj"), "obj")
+    assert len(index) == 0
+    assert index.get("a") is None
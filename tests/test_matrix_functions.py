@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix, random as sparse_random
+
+from ibcf.matrix_functions import get_topk
+
+
+def get_topk_per_row(matrix, top, axis=1):
+    """ The original row by row implementation of get_topk
+    """
+    rows, cols, data = [], [], []
+    if axis == 0:
+        matrix = matrix.T.tocsr()
+
+    for row_id, row in enumerate(matrix):
+        if top is not None and row.nnz > top:
+            top_args = np.argsort(row.data)[-top:]
+            rows += [row_id] * top
+            cols += row.indices[top_args].tolist()
+            data += row.data[top_args].tolist()
+        elif row.nnz > 0:
+            rows += [row_id] * row.nnz
+            cols += row.indices.tolist()
+            data += row.data.tolist()
+
+    topk_m = csr_matrix((data, (rows, cols)), (matrix.shape[0], matrix.shape[1]))
+    return topk_m.T.tocsr() if axis == 0 else topk_m
+
+
+@pytest.mark.parametrize("axis", [0, 1])
+@pytest.mark.parametrize("top", [None, 1, 3, 10, 1000])
+def test_topk_matches_per_row(axis, top):
+    # continuous values have no ties
+    m = sparse_random(60, 40, density=0.2, format="csr", random_state=0)
+    np.testing.assert_array_equal(get_topk(m, top, axis).toarray(), get_topk_per_row(m, top, axis).toarray())
+
+
+def test_topk_keeps_later_ties():
+    m = csr_matrix(np.array([[1, 2, 1, 1, 0], [0, 0, 0, 0, 5]], dtype=float))
+    np.testing.assert_array_equal(get_topk(m, 2).toarray(), [[0, 2, 0, 1, 0], [0, 0, 0, 0, 5]])
+    np.testing.assert_array_equal(get_topk(m.T, 2, axis=0).T.toarray(), [[0, 2, 0, 1, 0], [0, 0, 0, 0, 5]])
+
+
+def test_topk_of_empty_rows():
+    m = csr_matrix((3, 4))
+    assert get_topk(m, 2).nnz == 0
+    assert get_topk(m, 2).shape == (3, 4)
+
+
+def test_topk_doesnt_change_input():
+    m = sparse_random(20, 20, density=0.3, format="csr", random_state=0)
+    data = m.data.copy()
+    get_topk(m, 2)
+    np.testing.assert_array_equal(m.data, data)
@@ -0,0 +1,39 @@
+import pytest
+
+from ibcf.parallel import get_blocks
+from ibcf.recs import get_topk_recs
+from ibcf.similarity import get_ib_topk_cosine_sim
+from tests.conftest import assert_same_matrix
+
+
+@pytest.mark.parametrize("n, block_size, workers, expected", [
+    (10, 4, 1, ([0, 4, 8], 4)),
+    (10, 100, 2, ([0, 2, 4, 6, 8], 2)),
+    (3, 100, 4, ([0, 1, 2], 1)),
+    (0, 4, 2, ([], 1)),
+])
+def test_get_blocks(n, block_size, workers, expected):
+    assert get_blocks(n, block_size, workers) == expected
+
+
+def test_parallel_sim_matches_serial(ui_matrix):
+    pytest.importorskip("sharedmem")
+    assert_same_matrix(
+        get_ib_topk_cosine_sim(ui_matrix, 5, block_size=7, workers=2),
+        get_ib_topk_cosine_sim(ui_matrix, 5, block_size=7)
+    )
+
+
+def test_parallel_recs_match_serial(ui_matrix):
+    pytest.importorskip("sharedmem")
+    sim_m = get_ib_topk_cosine_sim(ui_matrix, 10)
+    assert_same_matrix(
+        get_topk_recs(ui_matrix, sim_m, top=5, workers=2),
+        get_topk_recs(ui_matrix, sim_m, top=5)
+    )
+
+
+def test_parallel_recs_of_no_users(ui_matrix):
+    pytest.importorskip("sharedmem")
+    sim_m = get_ib_topk_cosine_sim(ui_matrix, 10)
+    assert get_topk_recs(ui_matrix[:0], sim_m, top=5, workers=2).shape == (0, 40)
@@ -0,0 +1,25 @@
+import os
+import time
+
+from server.profiling import SlowRequestWatchdog, get_worker_log_path
+
+
+def test_worker_log_path():
+    assert get_worker_log_path("/var/log/slow.log", 1234) == "/var/log/slow.1234.log"
+    assert get_worker_log_path("slow", 1234) == "slow.1234"
+
+
+def test_slow_requests_are_sampled_to_worker_file(tmp_path):
+    log_path = str(tmp_path / "slow.log")
+    watchdog = SlowRequestWatchdog(0.01, log_path, interval=0.01, max_samples=2)
+    watchdog.start()
+
+    watchdog.request_started("/api/slow/")
+    time.sleep(0.2)
+    watchdog.request_finished()
+
+    assert not os.path.exists(log_path)
+    with open(get_worker_log_path(log_path)) as f:
+        samples = f.read()
+    assert samples.count("/api/slow/ has been running for") == 2
+    assert "test_slow_requests_are_sampled_to_worker_file" in samples
@@ -0,0 +1,152 @@
+import json
+
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix
+
+from benchmark.synthetic_model import generate_sources, write_config
+from server import get_app
+from server.app import APIApp
+from server.api.views import get_cluster_based_results, get_content_based_results
+from server.data_provider import ItemDataProvider
+from server.model import Model
+from server.recommender import PopItemRecommender
+
+UNKNOWN_UID = "unknown"
+
+
+@pytest.fixture(scope="module")
+def app(tmp_path_factory):
+    path = tmp_path_factory.mktemp("model")
+    config_path = str(path / "config.py")
+    write_config(config_path, generate_sources(str(path), 600))
+    return get_app(config_path)
+
+
+@pytest.fixture(scope="module")
+def uids(app):
+    return app.model.user_dp.get_uids()[:150] + [UNKNOWN_UID]
+
+
+def get_single_results(app, url, uids, args):
+    client = app.test_client()
+    results = {}
+    for uid in uids:
+        response = client.get(url, query_string=dict(args, uid=uid))
+        results[uid] = json.loads(response.get_data(as_text=True))["result"]
+    return results
+
+
+def get_batch_results(app, url, uids, args):
+    response = app.test_client().post(url, data=json.dumps(dict(args, uids=uids)))
+    return json.loads(response.get_data(as_text=True))["result"]
+
+
+@pytest.mark.parametrize("top_clusters, top_items", [(3, 5), (1, 1), (10, 2), (0, 0)])
+def test_cluster_recs_batch_matches_single(app, uids, top_clusters, top_items):
+    args = {"top": top_clusters, "top_items": top_items}
+    single = get_single_results(app, "/api/cluster/recs/", uids, args)
+    batch = get_batch_results(app, "/api/cluster/recs/batch/", uids, args)
+
+    assert batch == single
+    assert single[UNKNOWN_UID] == {}
+    assert any(res and res["recs"] for res in single.values())
+
+
+@pytest.mark.parametrize("top_items", [5, 1, 0])
+def test_item_recs_batch_matches_single(app, uids, top_items):
+    args = {"top": top_items}
+    single = get_single_results(app, "/api/item/recs/", uids, args)
+    batch = get_batch_results(app, "/api/item/recs/batch/", uids, args)
+
+    assert batch == single
+    assert single[UNKNOWN_UID] == {}
+    assert any(res and res["recs"] for res in single.values())
+
+
+def test_item_recs_are_sorted(app, uids):
+    results = get_batch_results(app, "/api/item/recs/batch/", uids, {"top": 5})
+    for res in results.values():
+        if res:
+            scores = [rec["score"] for rec in res["recs"]]
+            assert len(scores) <= 5
+            assert scores == sorted(scores, reverse=True)
+
+
+@pytest.fixture(scope="module")
+def raw_model(app):
+    return Model.load(app.config, "v1")
+
+
+def test_every_raw_load_has_own_version(app, raw_model):
+    response = app.test_client().get("/api/ping/")
+    version = json.loads(response.get_data(as_text=True))["model_version"]
+
+    assert version == app.model.version
+    assert version.startswith("raw-")
+    assert Model.load(app.config).version not in (version, raw_model.version)
+
+
+@pytest.mark.parametrize("mmap_arrays", [False, True])
+def test_bundle_model_matches_raw(raw_model, uids, tmp_path, mmap_arrays):
+    path = str(tmp_path / "model.npz")
+    raw_model.dump(path)
+    model = Model.load_bundle(path, mmap_arrays)
+    assert model.version == "v1"
+
+    for get_results in (
+        lambda m: get_cluster_based_results(m, uids, 3, 5),
+        lambda m: get_content_based_results(m, uids, 5),
+    ):
+        assert APIApp.dump_json(get_results(model)) == APIApp.dump_json(get_results(raw_model))
+
+
+def test_bundle_maps_derived_arrays(raw_model, tmp_path):
+    path = str(tmp_path / "model.npz")
+    raw_model.dump(path)
+    model = Model.load_bundle(path, mmap_arrays=True)
+
+    # the arrays are mapped from the bundle instead of being rebuilt by every worker
+    for arr in (
+        model.bg_recommender._rank_bg_ids,
+        model.bg_recommender._rank_scores,
+        model.item_cb_recommender._norm_if_m.data,
+        model.item_cb_recommender._active_mask,
+        model.item_dp._bg_rank_cols,
+        model.item_dp._bg_rank_scores,
+        model.item_dp.get_active_iids(),
+        model.item_dp.active_col_mask,
+        model.item_dp._iid_per_bg,
+        model.item_dp._iid_bg_indptr,
+        model.item_dp._iid_bg_ids,
+        model.booking_dp._obs_iids,
+        model.booking_dp._obs_counts,
+    ):
+        assert not arr.flags["WRITEABLE"]
+
+
+def test_bg_iid_ranking_keeps_scores():
+    bg_iid_m = csr_matrix(np.array([[1, 1, 1], [0, 1, 1]], dtype=float))
+    item_dp = ItemDataProvider({"a", "b", "c"}, {"a": 0, "b": 1, "c": 2}, {0: "a", 1: "b", 2: "c"}, bg_iid_m)
+    item_dp.prepare_bg_iid_ranking(np.array([2, 1, 0]), np.array([3.0, 0.1, 1e-6]))
+
+    recs = item_dp.prepare_bg_iid_recs(0, np.array([], dtype=int))
+    assert recs == [{"propcode": "c", "score": 3.0}, {"propcode": "b", "score": 0.1},
+                    {"propcode": "a", "score": 1e-6}]
+
+
+@pytest.mark.parametrize("top_items", [5, 1, 0])
+def test_pop_recs_skip_booked_items(raw_model, uids, top_items):
+    recommender = PopItemRecommender(raw_model.booking_dp, raw_model.item_dp)
+    ranked_cols, ranked_scores = recommender.get_ranking()
+
+    assert raw_model.item_dp.active_col_mask[ranked_cols].all()
+    assert (np.diff(ranked_scores) <= 0).all()
+
+    for uid in uids:
+        mask = ~np.isin(ranked_cols, raw_model.booking_dp.get_iid_cols_for_uid(uid))
+        expected_cols = ranked_cols[mask][:top_items or None]
+
+        recs = recommender.get_recs(uid, top_items)
+        assert sorted(recs.indices.tolist()) == sorted(expected_cols.tolist())
+        np.testing.assert_array_equal(recs[0, expected_cols].toarray()[0], ranked_scores[mask][:expected_cols.size])
@@ -0,0 +1,46 @@
+import pytest
+from scipy.sparse import random as sparse_random
+from sklearn.preprocessing import binarize
+
+from ibcf.matrix_functions import get_topk
+from ibcf.recs import get_topk_recs
+from ibcf.similarity import get_ib_topk_cosine_sim
+from tests.conftest import assert_same_matrix
+
+
+def get_whole_recs(ui_vector, sim_matrix, e_matrix=None, top=None):
+    """ The original implementation scoring all users at once
+    """
+    recs_m = ui_vector.dot(sim_matrix)
+    recs_denom = binarize(ui_vector).dot(sim_matrix)
+    recs_m.data = recs_m.data / recs_denom.data
+
+    if e_matrix is not None:
+        recs_m = recs_m - recs_m.multiply(e_matrix)
+    return get_topk(recs_m, top) if top is not None else recs_m
+
+
+@pytest.fixture
+def sim_matrix(ui_matrix):
+    return get_ib_topk_cosine_sim(ui_matrix, 10)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 90, 1000])
+@pytest.mark.parametrize("top", [None, 5])
+def test_chunked_recs_match_whole(ui_matrix, sim_matrix, chunk_size, top):
+    recs_m = get_topk_recs(ui_matrix, sim_matrix, top=top, chunk_size=chunk_size)
+    assert_same_matrix(recs_m, get_whole_recs(ui_matrix, sim_matrix, top=top))
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1000])
+def test_chunked_recs_exclude_pairs(ui_matrix, sim_matrix, chunk_size):
+    e_matrix = binarize(sparse_random(90, 40, density=0.3, format="csr", random_state=1))
+    recs_m = get_topk_recs(ui_matrix, sim_matrix, e_matrix, top=5, chunk_size=chunk_size)
+
+    assert not recs_m.multiply(e_matrix).nnz
+    assert_same_matrix(recs_m, get_whole_recs(ui_matrix, sim_matrix, e_matrix, top=5))
+
+
+def test_recs_of_no_users(sim_matrix):
+    recs_m = get_topk_recs(sparse_random(0, 40, format="csr"), sim_matrix, top=5)
+    assert recs_m.shape == (0, 40)
@@ -0,0 +1,58 @@
+from collections import namedtuple
+
+import pytest
+
+from server import reloader
+from server.app import APIApp
+from server.cache import LRUCache
+from server.exceptions import ModelReloadFailedException
+from server.reloader import ModelReloader, read_model_pointer
+
+FakeModel = namedtuple("FakeModel", ["version"])
+
+
+def test_pointer_is_relative_to_its_folder(tmp_path):
+    pointer_path = tmp_path / "current"
+    pointer_path.write_text(u"models/v2.npz\n")
+    assert read_model_pointer(str(pointer_path)) == str(tmp_path / "models" / "v2.npz")
+
+
+def test_absolute_pointer(tmp_path):
+    pointer_path = tmp_path / "current"
+    pointer_path.write_text(u"/data/v2.npz")
+    assert read_model_pointer(str(pointer_path)) == "/data/v2.npz"
+
+
+@pytest.fixture
+def app():
+    app = APIApp(__name__)
+    app.model = FakeModel("v1")
+    app.recs_store = None
+    app.recs_cache = LRUCache(max_entries=10)
+    app.recs_cache.set(("key", "v1"), "response")
+    return app
+
+
+def test_reload_swaps_model(app, monkeypatch):
+    monkeypatch.setattr(reloader, "load_model", lambda config: FakeModel("v2"))
+    assert ModelReloader(app).reload(wait=True)
+
+    assert app.model.version == "v2"
+    assert app.recs_cache.get(("key", "v1")) is None
+
+
+def test_failed_reload_keeps_model(app, monkeypatch):
+    def load_model(config):
+        raise IOError("partially written bundle")
+
+    monkeypatch.setattr(reloader, "load_model", load_model)
+    model_reloader = ModelReloader(app)
+    with pytest.raises(ModelReloadFailedException):
+        model_reloader.reload(wait=True)
+
+    assert app.model.version == "v1"
+    assert app.recs_cache.get(("key", "v1")) == "response"
+    # the lock is released, so the next reload can start
+    monkeypatch.setattr(reloader, "load_model", lambda config: FakeModel("v2"))
+    assert model_reloader.reload(wait=True)
+    assert app.model.version == "v2"
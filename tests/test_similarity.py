@@ -0,0 +1,25 @@
+import pytest
+from sklearn.preprocessing import normalize
+
+from ibcf.matrix_functions import nullify_main_diagonal, get_topk
+from ibcf.similarity import get_ib_topk_cosine_sim
+from tests.conftest import assert_same_matrix
+
+
+def get_whole_cosine_sim(ui_matrix, top=None):
+    """ The original implementation computing all similarities at once
+    """
+    iu_norm_m = normalize(ui_matrix.T.tocsr(), axis=1)
+    sim_m = nullify_main_diagonal(iu_norm_m.dot(iu_norm_m.T))
+    return get_topk(sim_m, top, axis=0) if top is not None else sim_m
+
+
+@pytest.mark.parametrize("block_size", [1, 7, 40, 1000])
+@pytest.mark.parametrize("top", [None, 5])
+def test_blocked_sim_matches_whole(ui_matrix, block_size, top):
+    sim_m = get_ib_topk_cosine_sim(ui_matrix, top, block_size=block_size)
+    assert_same_matrix(sim_m, get_whole_cosine_sim(ui_matrix, top))
+
+
+def test_blocked_sim_has_sorted_indices(ui_matrix):
+    assert get_ib_topk_cosine_sim(ui_matrix, 5, block_size=7).has_sorted_indices